@@ -0,0 +1,163 @@
+import argparse
+import cv2
+import json
+import numpy as np
+import pathlib
+import sys
+import time
+from featureMatcher import NFEATURES, STRATEGIES
+from posterTracker import PosterTracker, TrackerSettings
+from profiler import PERCENTILES, Profiler
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+# Headless benchmark of the detection and tracking pipeline on recorded video.
+# Takes a video file or a directory of frames, optionally with ground truth poster quads in a JSON file
+# mapping frame name (or frame number for videos) to four [x, y] corners, or null when no poster is visible.
+
+FRAME_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp")
+IOU_THRESHOLD = 0.5
+
+
+def readFrames(source):
+    # Yields (name, frame) from a video file or a directory of images. An image that can not be read
+    # is yielded with frame None, the video ends at its first frame that does not read
+    source = pathlib.Path(source)
+    if source.is_dir():
+        for path in sorted(source.iterdir()):
+            if path.suffix.lower() in FRAME_SUFFIXES:
+                yield path.name, cv2.imread(str(path))
+        return
+    video = cv2.VideoCapture(str(source))
+    if not video.isOpened():
+        raise FileNotFoundError(f"Could not open video {source}")
+    index = 0
+    while True:
+        ret, frame = video.read()
+        if not ret:
+            break
+        yield str(index), frame
+        index += 1
+    video.release()
+
+def loadGroundTruth(source, path=None):
+    if path is None:
+        source = pathlib.Path(source)
+        path = source / "groundtruth.json" if source.is_dir() else source.with_suffix(".json")
+        if not path.exists():
+            return None
+    with open(path) as f:
+        return {name: None if quad is None else np.float32(quad) for name, quad in json.load(f).items()}
+
+def quadIoU(a, b):
+    # Intersection over union of two convex quads
+    a, b = np.float32(a).reshape(-1, 1, 2), np.float32(b).reshape(-1, 1, 2)
+    intersection, _ = cv2.intersectConvexConvex(a, b)
+    union = cv2.contourArea(a) + cv2.contourArea(b) - intersection
+    return intersection/union if union > 0 else 0.0
+
+def peakMemoryMb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024**2 if sys.platform == "darwin" else peak/1024 # Bytes on macOS, kilobytes on Linux
+
+
+def runBenchmark(source, posterPath, strategy="bf", features=NFEATURES, templateTracking=False,
+                 groundTruthPath=None, warmup=5):
+    groundTruth = loadGroundTruth(source, groundTruthPath)
+    profiler = Profiler(window=None) # Keep every sample for the percentiles
+    settings = TrackerSettings(strategy)
+    settings.imageDetection = True
+    settings.homographyTracking = True
+    settings.trackingObject = templateTracking
+    tracker = None
+
+    truePositives = falsePositives = positives = frames = skipped = 0
+    start = None
+    frameIterator = readFrames(source)
+
+    while True:
+        if frames == warmup and start is None: # The first frames pay for lazy initialisation
+            profiler.reset()
+            start = time.perf_counter()
+        with profiler.stage("read"):
+            item = next(frameIterator, None)
+        if item is None:
+            break
+        name, frame = item
+        if frame is None:
+            print(f"Skipping {name}, it could not be read")
+            skipped += 1
+            continue
+        if tracker is None:
+            tracker = PosterTracker.fromFile(posterPath, frame.shape, settings=settings, features=features,
+                                             profiler=profiler)
+        with profiler.stage("process"): # Every stage after reading the frame
+            result = tracker.process(frame)
+        frames += 1
+
+        if groundTruth is not None and name in groundTruth:
+            truth = groundTruth[name]
+            positives += truth is not None
+            if result.corners is not None:
+                if truth is not None and quadIoU(result.corners, truth) >= IOU_THRESHOLD:
+                    truePositives += 1
+                else:
+                    falsePositives += 1
+
+    elapsed = time.perf_counter() - start if start is not None and frames > warmup else 0.0
+    report = {
+        "source": str(source),
+        "strategy": strategy,
+        "frames": frames,
+        "skipped": skipped,
+        "fps": (frames - warmup)/elapsed if frames > warmup and elapsed > 0 else 0.0,
+        "detections": tracker.homographyTracker.detections if tracker else 0,
+        "latencyMs": {
+            stage: {f"p{p}": stats[f"p{p}"] for p in PERCENTILES} for stage, stats in profiler.summary().items()
+        },
+        "peakMemoryMb": peakMemoryMb(),
+    }
+    if groundTruth is not None:
+        predicted = truePositives + falsePositives
+        report["recall"] = truePositives/positives if positives else None
+        report["precision"] = truePositives/predicted if predicted else None
+    return report
+
+def printReport(report):
+    print(f"{report['frames']} frames from {report['source']} with {report['strategy']} matching")
+    print(f"FPS: {report['fps']:.1f}, detections: {report['detections']}")
+    if report["skipped"]:
+        print(f"Skipped {report['skipped']} frames that could not be read")
+    for stage, values in report["latencyMs"].items():
+        print(f"{stage:>10}: " + ", ".join(f"{p} {v:.2f} ms" for p, v in values.items()))
+    if "recall" in report:
+        print(f"Recall: {report['recall']}, precision: {report['precision']}")
+    if report["peakMemoryMb"] is not None:
+        print(f"Peak memory: {report['peakMemoryMb']:.1f} MB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the AR pipeline on a video file or a directory of frames")
+    parser.add_argument("source")
+    parser.add_argument("--poster", default="booktest.png")
+    parser.add_argument("--matcher", choices=STRATEGIES, default="bf")
+    parser.add_argument("--features", type=int, default=NFEATURES)
+    parser.add_argument("--template", action="store_true", help="also run the multi-scale template tracker")
+    parser.add_argument("--ground-truth", help="JSON file with the poster quad of every frame")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--min-fps", type=float, help="exit with an error when slower than this")
+    args = parser.parse_args()
+
+    report = runBenchmark(args.source, args.poster, args.matcher, args.features, args.template, args.ground_truth)
+    printReport(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.min_fps is not None and report["fps"] < args.min_fps:
+        print(f"FPS {report['fps']:.1f} is below the required {args.min_fps}")
+        sys.exit(1)
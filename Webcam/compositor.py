@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+
+# Blends the overlay picture into camera frames in place.
+# The working buffer is allocated once, frames are never copied here: whoever wants a snapshot copies it.
+
+
+class Compositor:
+
+    def __init__(self, overlay, frameShape, opacity):
+        self.overlay = overlay
+        self.opacity = opacity
+        self.frame_H, self.frame_W = frameShape[:2]
+        overlay_h, overlay_w = overlay.shape[:2]
+        # Corners of the overlay, clockwise from the top left
+        self.overlayCorners = np.float32([[0, 0], [overlay_w, 0], [overlay_w, overlay_h], [0, overlay_h]])
+        # Warps only use the part of this buffer under the bounding box of the quad
+        self.warped = np.empty((self.frame_H, self.frame_W) + overlay.shape[2:], dtype=overlay.dtype)
+
+    def blend(self, frame, x, y):
+        # Blends the overlay with its top left corner at (x, y), writing straight into the frame
+        overlay_h, overlay_w = self.overlay.shape[:2]
+        region = frame[y:y+overlay_h, x:x+overlay_w]
+        cv2.addWeighted(region, 1 - self.opacity, self.overlay, self.opacity, 0, dst=region)
+        return frame
+
+    def warp(self, frame, corners):
+        # Blends the overlay onto a quad of four [x, y] corners, clockwise from the top left, in place
+        corners = np.float32(corners).reshape(4, 2)
+        x0, y0 = np.maximum(np.floor(corners.min(axis=0)).astype(int), 0)
+        x1, y1 = np.minimum(np.ceil(corners.max(axis=0)).astype(int) + 1, (self.frame_W, self.frame_H))
+        if x1 <= x0 or y1 <= y0:
+            return frame
+
+        region = frame[y0:y1, x0:x1]
+        warped = self.warped[:y1-y0, :x1-x0]
+        # Outside the quad the buffer keeps the frame pixels, so blending leaves them as they were
+        np.copyto(warped, region)
+        transform = cv2.getPerspectiveTransform(self.overlayCorners, corners - np.float32([x0, y0]))
+        cv2.warpPerspective(self.overlay, transform, (x1 - x0, y1 - y0), dst=warped, borderMode=cv2.BORDER_TRANSPARENT)
+        cv2.addWeighted(region, 1 - self.opacity, warped, self.opacity, 0, dst=region)
+        return frame
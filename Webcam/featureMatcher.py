@@ -0,0 +1,104 @@
+import collections
+import cv2
+import numpy as np
+import time
+from matchGeometry import MatchGeometry, keypointCoordinates
+
+# Feature extraction and matching stage with a selectable strategy:
+#   bf    brute-force Hamming with cross check, the original prototype matcher
+#   flann approximate FLANN-LSH nearest neighbours with Lowe's ratio test
+#   knn   brute-force Hamming 2-nearest neighbours with Lowe's ratio test
+# Only the best topK matches are kept, selected with a partial sort instead of sorting them all.
+
+STRATEGIES = ("bf", "flann", "knn")
+RATIO = 0.75
+NFEATURES = 500
+FLANN_INDEX_LSH = 6
+FLANN_INDEX_PARAMS = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1)
+FLANN_SEARCH_PARAMS = dict(checks=50)
+
+MatchStats = collections.namedtuple("MatchStats", ["strategy", "features", "matches", "kept", "detectMs", "matchMs"])
+
+
+class FeatureExtractor:
+    # ORB with a descriptor budget, optionally only looking inside a region of interest
+
+    def __init__(self, nfeatures=NFEATURES, roi=None):
+        self.orb = cv2.ORB_create(nfeatures)
+        self.roi = roi # (x0, y0, x1, y1) or None for the whole frame
+        self.detectMs = 0.0
+
+    def extract(self, frame):
+        # Returns the keypoint coordinates in the frame and their descriptors
+        start = time.perf_counter()
+        x0, y0 = 0, 0
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            frame = frame[y0:y1, x0:x1]
+        keypoints, descriptors = self.orb.detectAndCompute(frame, None)
+        points = keypointCoordinates(keypoints)
+        if x0 or y0:
+            points += np.float32([x0, y0])
+        self.detectMs = (time.perf_counter() - start)*1000
+        return points, descriptors
+
+
+class FeatureMatcher:
+
+    def __init__(self, trainPoints, trainDescriptors, strategy="bf", topK=None, ratio=RATIO):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown matching strategy {strategy}, pick one of {STRATEGIES}")
+        self.trainPoints = trainPoints
+        self.trainDescriptors = trainDescriptors
+        self.strategy = strategy
+        self.topK = topK
+        self.ratio = ratio
+        self.stats = None
+        self.totals = collections.Counter()
+
+        if strategy == "bf":
+            self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+        elif strategy == "knn":
+            self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+        else:
+            # The LSH tables over the picture are built once here instead of on every frame
+            self.matcher = cv2.FlannBasedMatcher(FLANN_INDEX_PARAMS, FLANN_SEARCH_PARAMS)
+            self.matcher.add([trainDescriptors])
+            self.matcher.train()
+
+    def rawMatches(self, descriptors):
+        if self.strategy == "bf":
+            return self.matcher.match(descriptors, self.trainDescriptors)
+        if self.strategy == "knn":
+            pairs = self.matcher.knnMatch(descriptors, self.trainDescriptors, k=2)
+        else:
+            pairs = self.matcher.knnMatch(descriptors, k=2)
+        # Lowe's ratio test, LSH can return fewer than two neighbours
+        return [pair[0] for pair in pairs
+                if len(pair) == 2 and pair[0].distance < self.ratio*pair[1].distance]
+
+    def match(self, points, descriptors, detectMs=0.0):
+        # Returns the best matches as a MatchGeometry sorted by distance
+        start = time.perf_counter()
+        matches = []
+        if descriptors is not None and len(descriptors) and len(self.trainDescriptors):
+            matches = self.rawMatches(descriptors)
+        geometry = self.best(MatchGeometry.fromMatches(matches, points, self.trainPoints))
+        matchMs = (time.perf_counter() - start)*1000
+
+        self.stats = MatchStats(self.strategy, len(points), len(matches), len(geometry), detectMs, matchMs)
+        self.totals.update(frames=1, matches=len(matches), detectMs=detectMs, matchMs=matchMs)
+        return geometry
+
+    def best(self, geometry):
+        # Partial selection of the topK smallest distances, only those are sorted
+        if self.topK is None or len(geometry) <= self.topK:
+            return geometry.subset(np.argsort(geometry.distance, kind="stable"))
+        selected = np.argpartition(geometry.distance, self.topK - 1)[:self.topK]
+        return geometry.subset(selected[np.argsort(geometry.distance[selected], kind="stable")])
+
+    def summary(self):
+        # Average matches and milliseconds per frame so far
+        frames = max(self.totals["frames"], 1)
+        return (f"{self.strategy}: {self.totals['matches']/frames:.1f} matches, "
+                f"{self.totals['detectMs']/frames:.2f} ms detect, {self.totals['matchMs']/frames:.2f} ms match per frame")
@@ -0,0 +1,174 @@
+import collections
+import cv2
+import numpy as np
+import threading
+from matchGeometry import MatchGeometry, keypointCoordinates
+
+# Poster tracking with a homography.
+# The poster is found with feature matching and RANSAC only when tracking is lost, between detections
+# its points are followed with pyramidal Lucas-Kanade optical flow and the corners are moved with the
+# homography between the old and the new points.
+
+MIN_MATCHES = 12
+MIN_CONFIDENCE = 0.5
+MIN_POINTS = 8
+RANSAC_DETECT_THRESHOLD = 5.0
+RANSAC_TRACK_THRESHOLD = 3.0
+FORWARD_BACKWARD_THRESHOLD = 1.0 # Pixels a point may move when tracked forward and back again
+LK_PARAMS = dict(
+    winSize=(21, 21),
+    maxLevel=3,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01),
+)
+EXTRA_POINTS = 100 # Corners added inside the poster so tracking does not depend on the matches alone
+
+# corners is a 4x2 array of the poster corners in the frame, or None when the poster is not found
+TrackingState = collections.namedtuple("TrackingState", ["corners", "confidence", "detected"])
+
+
+def isPlausibleQuad(corners, frameShape):
+    # Rejects homographies that fold the poster over or shrink it to nothing
+    if corners is None or not np.all(np.isfinite(corners)):
+        return False
+    if not cv2.isContourConvex(corners.astype(np.float32).reshape(-1, 1, 2)):
+        return False
+    area = cv2.contourArea(corners.astype(np.float32))
+    return area > 0.001*frameShape[0]*frameShape[1]
+
+
+class HomographyTracker:
+
+    def __init__(self, target, orb=None, minConfidence=MIN_CONFIDENCE):
+        self.target = target
+        self.orb = orb if orb is not None else cv2.ORB_create()
+        self.bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+        self.minConfidence = minConfidence
+        h, w = target.shape
+        self.targetCorners = np.float32([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+        # The current and the previous frame, made once and swapped so no frame is allocated per update
+        self.buffers = None
+        self.reset()
+
+    def reset(self):
+        self.previousGray = None
+        self.points = None
+        self.corners = None
+        self.startPoints = 0
+        self.confidence = 0.0
+        self.detections = 0
+
+    def update(self, frameGray, sequence=None, features=None):
+        # Returns the TrackingState for a new grayscale frame, detecting again when confidence is too low.
+        # features() returns the frame's keypoint coordinates and descriptors when the caller already
+        # extracts them, it is only called when a detection is needed.
+        # sequence is only looked at by SharedHomographyTracker. frameGray is copied, the caller can reuse it
+        frameGray = self.nextBuffer(frameGray)
+        detected = False
+        if self.corners is not None and self.previousGray is not None:
+            self.track(frameGray)
+        if self.corners is None or self.confidence < self.minConfidence:
+            detected = self.detect(frameGray, features)
+        self.previousGray = frameGray
+        return TrackingState(self.corners, self.confidence, detected)
+
+    def nextBuffer(self, frameGray):
+        # Copies the frame into whichever buffer does not hold the previous frame
+        if self.buffers is None or self.buffers[0].shape != frameGray.shape:
+            self.buffers = (np.empty_like(frameGray), np.empty_like(frameGray))
+        buffer = self.buffers[1] if self.previousGray is self.buffers[0] else self.buffers[0]
+        np.copyto(buffer, frameGray)
+        return buffer
+
+    def detect(self, frameGray, features=None):
+        self.detections += 1
+        self.corners, self.points, self.confidence = None, None, 0.0
+        if features is not None:
+            points, descriptors = features()
+        else:
+            keypoints, descriptors = self.orb.detectAndCompute(frameGray, None)
+            points = keypointCoordinates(keypoints)
+        if descriptors is None or len(self.target.descriptors) == 0:
+            return False
+        matches = self.bf.match(descriptors, self.target.descriptors)
+        if len(matches) < MIN_MATCHES:
+            return False
+
+        geometry = MatchGeometry.fromMatches(matches, points, self.target.points)
+        framePoints = geometry.query.reshape(-1, 1, 2)
+        targetPoints = geometry.train.reshape(-1, 1, 2)
+        homography, mask = cv2.findHomography(targetPoints, framePoints, cv2.RANSAC, RANSAC_DETECT_THRESHOLD)
+        if homography is None:
+            return False
+        inliers = mask.ravel().astype(bool)
+        corners = cv2.perspectiveTransform(self.targetCorners, homography).reshape(4, 2)
+        if inliers.sum() < MIN_MATCHES or not isPlausibleQuad(corners, frameGray.shape):
+            return False
+
+        # Track the inlier matches together with strong corners inside the poster
+        points = framePoints[inliers]
+        mask = np.zeros(frameGray.shape[:2], dtype=np.uint8)
+        cv2.fillConvexPoly(mask, corners.astype(np.int32), 255)
+        extra = cv2.goodFeaturesToTrack(frameGray, EXTRA_POINTS, 0.01, 7, mask=mask)
+        if extra is not None:
+            points = np.concatenate([points, extra.astype(np.float32)])
+
+        self.corners = corners
+        self.points = points
+        self.startPoints = len(points)
+        self.confidence = 1.0
+        return True
+
+    def track(self, frameGray):
+        nextPoints, status, _ = cv2.calcOpticalFlowPyrLK(self.previousGray, frameGray, self.points, None, **LK_PARAMS)
+        backPoints, backStatus, _ = cv2.calcOpticalFlowPyrLK(frameGray, self.previousGray, nextPoints, None, **LK_PARAMS)
+        drift = np.linalg.norm((self.points - backPoints).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (backStatus.ravel() == 1) & (drift < FORWARD_BACKWARD_THRESHOLD)
+        if good.sum() < MIN_POINTS:
+            self.corners, self.confidence = None, 0.0
+            return
+
+        homography, mask = cv2.findHomography(self.points[good], nextPoints[good], cv2.RANSAC, RANSAC_TRACK_THRESHOLD)
+        if homography is None:
+            self.corners, self.confidence = None, 0.0
+            return
+        corners = cv2.perspectiveTransform(self.corners.reshape(-1, 1, 2), homography).reshape(4, 2)
+        if not isPlausibleQuad(corners, frameGray.shape):
+            self.corners, self.confidence = None, 0.0
+            return
+
+        inliers = mask.ravel().astype(bool)
+        self.points = nextPoints[good][inliers]
+        self.corners = corners
+        # Share of the points from the last detection that are still followed consistently
+        self.confidence = len(self.points)/max(self.startPoints, 1)
+
+
+class SharedHomographyTracker:
+    # One HomographyTracker shared by the detection threads of the pipelined prototype.
+    # Optical flow needs consecutive frames, so updates take turns and a frame older than the last one
+    # tracked leaves the state alone instead of tracking backwards
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.lock = threading.Lock()
+        self.lastSequence = -1
+
+    @property
+    def corners(self):
+        return self.tracker.corners
+
+    @property
+    def detections(self):
+        return self.tracker.detections
+
+    def reset(self):
+        with self.lock:
+            self.tracker.reset()
+
+    def update(self, frameGray, sequence=None, features=None):
+        with self.lock:
+            if sequence is not None:
+                if sequence <= self.lastSequence:
+                    return TrackingState(self.tracker.corners, self.tracker.confidence, False)
+                self.lastSequence = sequence
+            return self.tracker.update(frameGray, features=features)
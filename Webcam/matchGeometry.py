@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+
+# Geometry of a set of feature matches as NumPy arrays.
+# cv2.DMatch and cv2.KeyPoint objects are read once per frame, everything after that
+# (hotspots, likeness, region checks) is array operations.
+
+
+def keypointCoordinates(keypoints):
+    # (x, y) of every keypoint as an N x 2 float32 array
+    if len(keypoints) == 0:
+        return np.empty((0, 2), dtype=np.float32)
+    return cv2.KeyPoint_convert(keypoints).reshape(-1, 2)
+
+
+class MatchGeometry:
+    # query and train are N x 2 arrays of the matched point in the frame and in the picture,
+    # in the same order as the matches they were made from
+
+    def __init__(self, query, train, distance, queryIdx=None, trainIdx=None):
+        self.query = query
+        self.train = train
+        self.distance = distance
+        self.queryIdx = queryIdx
+        self.trainIdx = trainIdx
+
+    @classmethod
+    def fromMatches(cls, matches, queryPoints, trainPoints):
+        # queryPoints and trainPoints are keypoint coordinate arrays, see keypointCoordinates
+        count = len(matches)
+        queryIdx = np.fromiter((m.queryIdx for m in matches), dtype=np.int64, count=count)
+        trainIdx = np.fromiter((m.trainIdx for m in matches), dtype=np.int64, count=count)
+        distance = np.fromiter((m.distance for m in matches), dtype=np.float32, count=count)
+        return cls(queryPoints[queryIdx], trainPoints[trainIdx], distance, queryIdx, trainIdx)
+
+    def __len__(self):
+        return len(self.distance)
+
+    def subset(self, selection):
+        # New geometry with only the selected matches, selection is a slice, mask or index array
+        return MatchGeometry(
+            self.query[selection],
+            self.train[selection],
+            self.distance[selection],
+            None if self.queryIdx is None else self.queryIdx[selection],
+            None if self.trainIdx is None else self.trainIdx[selection],
+        )
+
+    def first(self, amount):
+        return self.subset(slice(0, amount))
+
+    def queryPixels(self):
+        # Frame points rounded to whole pixels, the way they are drawn
+        return np.round(self.query).astype(np.int32)
+
+    def trainPixels(self, offset=(0, 0)):
+        # Picture points moved by offset (x, y) into the frame and rounded to whole pixels
+        return np.round(self.train).astype(np.int32) + np.asarray(offset, dtype=np.int32)
+
+
+def inRegion(points, xRange, yRange):
+    # Mask of the points strictly inside the box xRange[0] < x < xRange[1], yRange[0] < y < yRange[1]
+    x, y = points[:, 0], points[:, 1]
+    return (x > xRange[0]) & (x < xRange[1]) & (y > yRange[0]) & (y < yRange[1])
+
+def displacement(geometry, offset=(0, 0)):
+    # Pixel distance between where every match is in the frame and where it is in the placed picture
+    difference = geometry.queryPixels() - geometry.trainPixels(offset)
+    return np.sqrt((difference.astype(np.float32)**2).sum(axis=1))
@@ -0,0 +1,123 @@
+import collections
+import queue
+import threading
+
+# Threaded capture -> detection -> display pipeline.
+# Every stage runs in its own thread and the stages are linked by small queues that drop the
+# oldest item when full, so a slow stage never makes the others work on stale frames.
+
+
+class DropOldestQueue:
+    # Bounded queue where put never blocks, a full queue throws away its oldest item instead
+
+    def __init__(self, maxsize=1):
+        self.items = collections.deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        # Raises queue.Empty on timeout or once the queue is closed and drained
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items or self.closed, timeout):
+                raise queue.Empty
+            if not self.items:
+                raise queue.Empty
+            return self.items.popleft()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class FramePipeline:
+    # readFrame() -> (ret, frame) runs in the capture thread, processFrame(frame, sequence) -> result in a pool
+    # of worker threads, and results() is consumed by the display loop. sequence counts the captured frames.
+    # OpenCV releases the GIL in its heavy calls, so the worker threads run in parallel.
+
+    def __init__(self, readFrame, processFrame, workers=2, queueSize=2):
+        self.readFrame = readFrame
+        self.processFrame = processFrame
+        self.frames = DropOldestQueue(1) # Only the latest camera frame is worth processing
+        self.processed = DropOldestQueue(queueSize)
+        self.running = threading.Event()
+        self.threads = [threading.Thread(target=self.capture, name="capture", daemon=True)]
+        self.threads += [
+            threading.Thread(target=self.work, name=f"worker-{i}", daemon=True) for i in range(workers)
+        ]
+        self.activeWorkers = workers
+        self.workersLock = threading.Lock()
+        self.error = None
+        self.lastShown = -1
+
+    def start(self):
+        self.running.set()
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.running.clear()
+        self.frames.close()
+        self.processed.close()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2)
+
+    def capture(self):
+        sequence = 0
+        while self.running.is_set():
+            ret, frame = self.readFrame()
+            if not ret:
+                print("failed to grab frame")
+                break
+            self.frames.put((sequence, frame))
+            sequence += 1
+        self.frames.close()
+
+    def work(self):
+        while self.running.is_set():
+            try:
+                sequence, frame = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                if self.frames.closed:
+                    break
+                continue
+            try:
+                result = self.processFrame(frame, sequence)
+            except Exception as e: # Surface worker errors in the display loop instead of dying silently
+                self.error = e
+                self.running.clear()
+                break
+            self.processed.put((sequence, result))
+        with self.workersLock: # The last worker to leave closes the result queue
+            self.activeWorkers -= 1
+            if self.activeWorkers == 0:
+                self.processed.close()
+
+    def results(self):
+        # Yields processed results in frame order, results that finish after a newer frame are skipped
+        while self.running.is_set() or self.processed.items:
+            try:
+                sequence, result = self.processed.get(timeout=0.5)
+            except queue.Empty:
+                if self.processed.closed:
+                    break
+                continue
+            if sequence < self.lastShown:
+                continue
+            self.lastShown = sequence
+            yield result
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        return {"dropped frames": self.frames.dropped, "dropped results": self.processed.dropped}
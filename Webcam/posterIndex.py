@@ -0,0 +1,258 @@
+import argparse
+import cv2
+import numpy as np
+import time
+from referenceTarget import ReferenceTarget, posterFiles
+
+# Bag of visual words index over the ORB descriptors of every poster.
+# Descriptors are quantised to binary visual words with a vocabulary tree, every poster becomes a
+# tf-idf vector, and a query only touches the posting lists of the words that appear in the camera frame.
+
+BRANCHING = 16
+DEPTH = 3 # BRANCHING**DEPTH visual words
+TRAINING_SAMPLE = 200000
+KMAJORITY_ITERATIONS = 8
+STOP_WORD_FRACTION = 0.25 # Words found in more posters than this do not help telling them apart
+POSTER_HEIGHT = 480
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def unpackDescriptors(descriptors):
+    # 32 byte ORB descriptors to rows of 256 bits, as floats so distances become a matrix product
+    return np.unpackbits(descriptors, axis=1).astype(np.float32)
+
+def nearestCenters(bits, centerBits):
+    # Index of the closest center in Hamming distance for every row of bits
+    # |a xor b| = |a| + |b| - 2 a.b, the |a| term is the same for every center so it is left out
+    return np.argmin(centerBits.sum(axis=1)[None, :] - 2*(bits @ centerBits.T), axis=1)
+
+def kMajority(bits, k, rng, iterations=KMAJORITY_ITERATIONS):
+    # The binary version of k-means, centers are the bitwise majority of their members
+    if len(bits) <= k: # Too few descriptors to split, pad with repeats
+        return bits[rng.choice(len(bits), k, replace=len(bits) < k)].copy()
+    centers = bits[rng.choice(len(bits), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = nearestCenters(bits, centers)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, bits)
+        members = np.bincount(labels, minlength=k)
+        filled = members > 0 # Empty clusters keep their old center
+        centers[filled] = (sums[filled] > members[filled, None]/2).astype(np.float32)
+    return centers
+
+def trainVocabulary(descriptors, branching=BRANCHING, depth=DEPTH, seed=0):
+    # Hierarchical k-majority clustering on a sample of all descriptors.
+    # Returns the centers of every level stacked, the children of node j on one level are
+    # j*branching .. j*branching + branching - 1 on the next level.
+    rng = np.random.default_rng(seed)
+    if len(descriptors) > TRAINING_SAMPLE:
+        descriptors = descriptors[rng.choice(len(descriptors), TRAINING_SAMPLE, replace=False)]
+    levels = []
+    groups = [unpackDescriptors(descriptors)]
+    for _ in range(depth):
+        centers, nextGroups = [], []
+        for bits in groups:
+            levelCenters = kMajority(bits, branching, rng)
+            labels = nearestCenters(bits, levelCenters)
+            centers.append(levelCenters)
+            for child in range(branching):
+                members = bits[labels == child]
+                nextGroups.append(members if len(members) else levelCenters[child:child + 1])
+        levels.append(np.packbits(np.concatenate(centers).astype(np.uint8), axis=1))
+        groups = nextGroups
+    return np.concatenate(levels)
+
+
+class VocabularyTree:
+    # Quantises descriptors to leaf words by descending the tree, so the cost grows with
+    # branching*depth instead of the number of words
+
+    def __init__(self, vocabulary, branching):
+        self.vocabulary = vocabulary
+        self.branching = branching
+        self.levels = []
+        start, size = 0, branching
+        while start < len(vocabulary):
+            self.levels.append(vocabulary[start:start + size])
+            start += size
+            size *= branching
+        self.size = len(self.levels[-1])
+
+    def words(self, descriptors):
+        nodes = np.zeros(len(descriptors), dtype=np.int64)
+        rows = np.arange(len(descriptors))
+        for centers in self.levels:
+            children = nodes[:, None]*self.branching + np.arange(self.branching)
+            # Hamming distance to every child as a popcount of the xor, descriptors x branching
+            differing = np.bitwise_xor(centers[children], descriptors[:, None, :])
+            distances = POPCOUNT[differing].sum(axis=2, dtype=np.uint16)
+            nodes = children[rows, np.argmin(distances, axis=1)]
+        return nodes
+
+
+class PosterIndex:
+
+    def __init__(self, vocabulary, branching, idf, wordOffsets, postingPosters, postingWeights, movieIds):
+        self.tree = VocabularyTree(vocabulary, branching)
+        self.idf = idf
+        self.wordOffsets = wordOffsets
+        self.postingPosters = postingPosters
+        self.postingWeights = postingWeights
+        self.movieIds = movieIds
+
+    @classmethod
+    def build(cls, posterDir, height=POSTER_HEIGHT, branching=BRANCHING, depth=DEPTH):
+        # Build the index from every poster in a directory, the file name of a poster is its movie_id
+        orb = cv2.ORB_create()
+        movieIds, allDescriptors = [], []
+        for movieId, posterPath in posterFiles(posterDir):
+            try:
+                target = ReferenceTarget.fromFile(posterPath, height=height, orb=orb)
+            except FileNotFoundError as e:
+                print(e)
+                continue
+            if len(target.descriptors) == 0:
+                continue
+            movieIds.append(movieId)
+            allDescriptors.append(target.descriptors)
+        if not movieIds:
+            raise ValueError(f"No posters with features found in {posterDir}")
+        print(f"Training vocabulary on {len(movieIds)} posters")
+
+        vocabulary = trainVocabulary(np.concatenate(allDescriptors), branching, depth)
+        tree = VocabularyTree(vocabulary, branching)
+        size = tree.size
+
+        # Word histogram of every poster
+        postingWords, postingPosters, postingCounts = [], [], []
+        for poster, descriptors in enumerate(allDescriptors):
+            words, counts = np.unique(tree.words(descriptors), return_counts=True)
+            postingWords.append(words)
+            postingPosters.append(np.full(len(words), poster, dtype=np.int32))
+            postingCounts.append(counts/counts.sum())
+        postingWords = np.concatenate(postingWords)
+        postingPosters = np.concatenate(postingPosters)
+        postingCounts = np.concatenate(postingCounts)
+
+        documentFrequency = np.bincount(postingWords, minlength=size)
+        idf = np.log(len(movieIds)/np.maximum(documentFrequency, 1)).astype(np.float32)
+        idf[documentFrequency > STOP_WORD_FRACTION*len(movieIds)] = 0
+
+        # Normalise the tf-idf vector of every poster so scores are cosine similarities
+        weights = (postingCounts*idf[postingWords]).astype(np.float32)
+        norms = np.sqrt(np.bincount(postingPosters, weights=weights**2, minlength=len(movieIds)))
+        weights /= np.maximum(norms[postingPosters], 1e-12)
+
+        # Inverted index: posting lists sorted by word, wordOffsets[w]:wordOffsets[w + 1] belongs to word w
+        keep = weights > 0
+        order = np.argsort(postingWords[keep], kind="stable")
+        wordOffsets = np.zeros(size + 1, dtype=np.int64)
+        wordOffsets[1:] = np.cumsum(np.bincount(postingWords[keep], minlength=size))
+
+        return cls(
+            vocabulary,
+            branching,
+            idf,
+            wordOffsets,
+            postingPosters[keep][order],
+            weights[keep][order],
+            np.array(movieIds),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data["vocabulary"],
+                int(data["branching"]),
+                data["idf"],
+                data["wordOffsets"],
+                data["postingPosters"],
+                data["postingWeights"],
+                data["movieIds"],
+            )
+
+    def save(self, path):
+        np.savez(
+            path,
+            vocabulary=self.tree.vocabulary,
+            branching=self.tree.branching,
+            idf=self.idf,
+            wordOffsets=self.wordOffsets,
+            postingPosters=self.postingPosters,
+            postingWeights=self.postingWeights,
+            movieIds=self.movieIds,
+        )
+
+    def queryVector(self, descriptors):
+        # Sparse tf-idf vector of a frame as (words, weights)
+        return self.wordVector(self.tree.words(descriptors))
+
+    def wordVector(self, frameWords):
+        words, counts = np.unique(frameWords, return_counts=True)
+        weights = counts/counts.sum()*self.idf[words]
+        keep = weights > 0
+        words, weights = words[keep], weights[keep]
+        return words, weights/max(np.linalg.norm(weights), 1e-12)
+
+    def query(self, descriptors, k=5):
+        # Returns the k most likely movie_ids for the descriptors of a camera frame as (movie_id, score)
+        if descriptors is None or len(descriptors) == 0:
+            return []
+        return self.score(self.tree.words(descriptors), k)
+
+    def queryBatch(self, descriptorsList, k=5):
+        # query() for several frames, all their descriptors are quantised in one pass down the tree
+        sizes = [0 if descriptors is None else len(descriptors) for descriptors in descriptorsList]
+        filled = [descriptors for descriptors in descriptorsList if descriptors is not None and len(descriptors)]
+        if not filled:
+            return [[] for _ in descriptorsList]
+        words = np.split(self.tree.words(np.concatenate(filled)), np.cumsum(sizes)[:-1])
+        return [self.score(frameWords, k) if len(frameWords) else [] for frameWords in words]
+
+    def score(self, frameWords, k):
+        words, weights = self.wordVector(frameWords)
+        if len(words) == 0:
+            return []
+
+        # Gather the posting lists of the words in the frame only
+        starts, ends = self.wordOffsets[words], self.wordOffsets[words + 1]
+        lengths = ends - starts
+        positions = np.repeat(ends - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+        posters = self.postingPosters[positions]
+        scores = self.postingWeights[positions]*np.repeat(weights, lengths)
+
+        candidates, inverse = np.unique(posters, return_inverse=True)
+        candidateScores = np.bincount(inverse, weights=scores)
+        k = min(k, len(candidates))
+        best = np.argpartition(candidateScores, -k)[-k:]
+        best = best[np.argsort(candidateScores[best])[::-1]]
+        return [(str(self.movieIds[candidates[i]]), float(candidateScores[i])) for i in best]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or query the poster recognition index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    buildParser = subparsers.add_parser("build")
+    buildParser.add_argument("posters", nargs="?", default="../server/src/posters")
+    buildParser.add_argument("--index", default="posterIndex.npz")
+    buildParser.add_argument("--branching", type=int, default=BRANCHING)
+    buildParser.add_argument("--depth", type=int, default=DEPTH)
+    queryParser = subparsers.add_parser("query")
+    queryParser.add_argument("image")
+    queryParser.add_argument("--index", default="posterIndex.npz")
+    queryParser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = PosterIndex.build(args.posters, branching=args.branching, depth=args.depth)
+        index.save(args.index)
+        print(f"Saved index of {len(index.movieIds)} posters to {args.index}")
+    else:
+        index = PosterIndex.load(args.index)
+        image = cv2.imread(args.image)
+        _, descriptors = cv2.ORB_create().detectAndCompute(image, None)
+        start = time.perf_counter()
+        results = index.query(descriptors, args.k)
+        print(f"Query took {(time.perf_counter() - start)*1000:.2f} ms")
+        for movieId, score in results:
+            print(f"{movieId}: {score:.4f}")
@@ -0,0 +1,213 @@
+import collections
+import cv2
+import numpy as np
+from compositor import Compositor
+from featureMatcher import NFEATURES, FeatureExtractor, FeatureMatcher
+from homographyTracker import HomographyTracker
+from matchGeometry import displacement, inRegion
+from profiler import Profiler
+from referenceTarget import ReferenceTarget, cachePathFor, fileDigest
+from templateTracker import GRANULARITY_TRACKING, SPOTS_THRESHOLD, MultiScaleTracker
+
+# Headless poster detection and tracking, one PosterTracker per camera or stream.
+# All state lives on the instance, so several trackers can run side by side in one process.
+
+# Variables for the look of the picture
+BORDER_SIZE = 10
+OFF_WHITE = (227, 238, 246)
+OPACITY = 0.7
+RELATIVE_SIZE = 0.3
+# Variables for detecting features
+BEST_AMOUNT = 5
+PICTURE_RATIO = 0.5
+THRESHHOLD_PICTURE = 5
+# Variables for tracking objects
+METHOD_LIST = [cv2.TM_CCOEFF_NORMED, cv2.TM_CCORR_NORMED, cv2.TM_SQDIFF_NORMED]
+METHOD_LIST_STR = ["TM_CCOEFF_NORMED", "TM_CCORR_NORMED", "TM_SQDIFF_NORMED"]
+
+# frame is the input frame with the picture and drawings on it. When taking pictures and the picture
+# is in a hotspot, pictureFrame is a copy of the frame with only the picture on it and raw a copy of the
+# frame before anything was drawn on it, otherwise both are None. box is (x, y, width, height)
+# from the template tracker and corners the quad from the homography tracker
+TrackResult = collections.namedtuple("TrackResult", [
+    "frame", "pictureFrame", "raw", "descriptors", "matchStats", "hotspot", "similarity", "box", "corners", "confidence",
+])
+
+
+class TrackerSettings:
+    # What a tracker does on every frame. Trackers can share one settings object so a
+    # key press changes all of them at once
+
+    def __init__(self, matchStrategy="bf"):
+        self.imageDetection = False
+        self.trackingObject = False
+        self.homographyTracking = False
+        self.takePictures = False
+        self.anchorOverlay = False # Blend the picture onto the tracked poster instead of the middle of the frame
+        self.thresholdPicture = THRESHHOLD_PICTURE
+        self.currentMethod = 0
+        self.matchStrategy = matchStrategy
+
+
+class PosterTracker:
+
+    def __init__(self, picture, frameShape, settings=None, features=NFEATURES, roi=None, cachePath=None, profiler=None,
+                 homographyTracker=None, cacheSource=None):
+        # picture is the BGR image that is overlaid and looked for, frameShape the shape of the camera frames
+        self.settings = settings if settings is not None else TrackerSettings()
+        self.profiler = profiler if profiler is not None else Profiler(False)
+        frame_H, frame_W = frameShape[:2]
+
+        # Scale and format the picture that is going to overlay
+        shape_org = picture.shape[:2]
+        scaleFactor = RELATIVE_SIZE*frame_H/shape_org[0]
+        self.overlay = cv2.resize(picture, (round(shape_org[1]*scaleFactor), round(shape_org[0]*scaleFactor)))
+        overlay_w, overlay_h = self.overlay.shape[:2]
+
+        # Add border
+        self.overlay[0:BORDER_SIZE,0:] = OFF_WHITE
+        self.overlay[overlay_w-BORDER_SIZE:overlay_w,0:] = OFF_WHITE
+        self.overlay[0:,0:BORDER_SIZE] = OFF_WHITE
+        self.overlay[0:,overlay_h-BORDER_SIZE:overlay_h] = OFF_WHITE
+
+        # The overlay never changes, so its features are computed once and cached
+        self.target = ReferenceTarget(self.overlay, cachePath=cachePath, source=cacheSource)
+
+        # Place the overlay in the middle of the frame, fixing rounding errors to get the correct size
+        self.pos_w_0 = round((frame_H - overlay_w)/2)
+        self.pos_w_1 = self.pos_w_0 + overlay_w
+        self.pos_h_0 = round((frame_W - overlay_h)/2)
+        self.pos_h_1 = self.pos_h_0 + overlay_h
+
+        self.extractor = FeatureExtractor(features, roi)
+        self.matchers = {}
+        # Scaled versions of the picture for tracking, searched coarse-to-fine
+        self.templateTracker = MultiScaleTracker(cv2.cvtColor(picture, cv2.COLOR_BGR2GRAY), frame_H, GRANULARITY_TRACKING)
+        # Follows the picture with optical flow and only matches features again when tracking is lost.
+        # Trackers on several threads of one camera share one, see SharedHomographyTracker
+        self.homographyTracker = homographyTracker if homographyTracker is not None else HomographyTracker(self.target)
+
+        # Blends the overlay into the frame in place
+        self.compositor = Compositor(self.overlay, frameShape, OPACITY)
+        # Working buffer, made once and reused on every frame
+        self.gray = np.empty((frame_H, frame_W), dtype=np.uint8)
+        self.frames = 0
+
+    @classmethod
+    def fromFile(cls, picturePath, frameShape, **kwargs):
+        picture = cv2.imread(str(picturePath))
+        if picture is None:
+            raise FileNotFoundError(f"Could not read picture {picturePath}")
+        # The overlay's size follows the frame height, so that is part of the cache's name
+        kwargs.setdefault("cachePath", cachePathFor(picturePath, round(RELATIVE_SIZE*frameShape[0]), kind="overlay"))
+        kwargs.setdefault("cacheSource", fileDigest(picturePath))
+        return cls(picture, frameShape, **kwargs)
+
+    def matcher(self):
+        # The matcher for the current strategy, made the first time it is used
+        strategy = self.settings.matchStrategy
+        if strategy not in self.matchers:
+            self.matchers[strategy] = FeatureMatcher(
+                self.target.points, self.target.descriptors, strategy, topK=BEST_AMOUNT + 2
+            )
+        return self.matchers[strategy]
+
+    def isHotSpot(self, geometry):
+        # Returns if the current location for the screenshot is a hotspot of matches, and how similar it is
+        best = geometry.first(BEST_AMOUNT + 2)
+        inside = inRegion(best.queryPixels(), (self.pos_h_0, self.pos_h_1), (self.pos_w_0, self.pos_w_1))
+        spotAmount = int(inside.sum())
+
+        if spotAmount == 0:
+            return False, None
+
+        likeness = float(displacement(best.subset(inside), (self.pos_h_0, self.pos_w_0)).mean())
+        if likeness == 0:
+            likeness = 0.001
+
+        similarity = self.settings.thresholdPicture/likeness
+        return spotAmount > BEST_AMOUNT*PICTURE_RATIO and likeness < self.settings.thresholdPicture, similarity
+
+    def process(self, frame, sequence=None):
+        # Runs feature matching, blending and tracking on a camera frame, drawing on it.
+        # sequence is the frame's number from the camera when frames are processed out of order
+        settings = self.settings
+        profiler = self.profiler
+        self.frames += 1
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+
+        # Features are extracted at most once per frame. With only homography tracking on nothing else
+        # needs them, so they are left out while the tracker holds the poster and only extracted for
+        # the full detection when it loses it
+        features = []
+        def frameFeatures():
+            if not features:
+                features.append(self.extractor.extract(frame))
+            return features[0]
+
+        if not settings.homographyTracking or settings.imageDetection or settings.trackingObject:
+            with profiler.stage("orb"):
+                frameFeatures()
+
+        state = None
+        if settings.homographyTracking:
+            with profiler.stage("homography"):
+                # The tracker copies the gray buffer into its own, it keeps the previous frame
+                state = self.homographyTracker.update(self.gray, sequence, frameFeatures)
+        elif self.homographyTracker.corners is not None:
+            self.homographyTracker.reset()
+        corners, confidence = (state.corners, state.confidence) if state is not None else (None, 0.0)
+
+        # Calucate features and map them
+        descriptors, matchStats = None, None
+        spots = None
+        hotspot, similarity = False, None
+        if features:
+            points, descriptors = features[0]
+            matcher = self.matcher()
+            with profiler.stage("matching"):
+                geometry = matcher.match(points, descriptors, self.extractor.detectMs)
+            matchStats = matcher.stats
+            spots = geometry.first(BEST_AMOUNT + 1)
+            if settings.imageDetection:
+                # Take a photo if the picture is in a hotspot
+                hotspot, similarity = self.isHotSpot(geometry)
+
+        box = None
+        if settings.trackingObject and spots is not None: # Settings can change on another thread mid frame
+            with profiler.stage("template"):
+                box = self.templateTracker.find(
+                    self.gray, spots.queryPixels(), METHOD_LIST[settings.currentMethod], SPOTS_THRESHOLD
+                )
+
+        # The frame is only copied when a picture is going to be taken
+        snapshot = hotspot and settings.takePictures
+        raw = frame.copy() if snapshot else None
+
+        # Blend the picture into the frame
+        with profiler.stage("blending"):
+            if settings.anchorOverlay and corners is not None:
+                self.compositor.warp(frame, corners)
+            else:
+                self.compositor.blend(frame, self.pos_h_0, self.pos_w_0)
+        pictureFrame = frame.copy() if snapshot else None
+
+        if settings.imageDetection and spots is not None:
+            trainPixels = spots.trainPixels((self.pos_h_0, self.pos_w_0)).tolist()
+            for point1, point2 in zip(spots.queryPixels().tolist(), trainPixels):
+                cv2.circle(frame, center = tuple(point1), radius = 10, color =(0,255,0), thickness=2)
+                cv2.circle(frame, center = tuple(point2), radius = 5, color= (255,255,0), thickness=2)
+
+        if box is not None:
+            highest, bestx, besty, bestw, besth = box
+            box = (bestx, besty, bestw, besth)
+            cv2.rectangle(frame, (bestx,besty), (bestx+int(bestw),besty+int(besth)), color =(0,255,0), thickness=2)
+
+        if corners is not None:
+            cv2.polylines(frame, [corners.astype(np.int32)], True, color=(255,0,255), thickness=2)
+            cv2.putText(frame, f"{confidence:.2f}", tuple(corners[0].astype(int)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,0,255), 2)
+
+        return TrackResult(
+            frame, pictureFrame, raw, descriptors, matchStats, hotspot, similarity, box, corners, confidence,
+        )
@@ -0,0 +1,147 @@
+import collections
+import contextlib
+import csv
+import cv2
+import json
+import numpy as np
+import threading
+import time
+
+# Named stage timers with rolling histograms, an optional on-frame HUD and export to CSV or JSON lines.
+# When the profiler is disabled stage() hands out one shared no-op context, so timing costs nothing.
+
+WINDOW = 300 # Samples kept per stage for the rolling statistics
+PERCENTILES = (50, 95, 99)
+HUD_COLOUR = (0, 255, 255)
+FLUSH_EVERY = 50 # Frames buffered before the export file is written
+
+NULL_TIMER = contextlib.nullcontext()
+
+
+class StageTimer:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+
+    def __init__(self, enabled=True, window=WINDOW, exportPath=None, stages=None):
+        self.enabled = enabled
+        self.stages = stages # Known stage names, fixes the CSV columns
+        self.window = window # None keeps every sample
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self.frameTimes = collections.deque(maxlen=self.window or WINDOW)
+        self.lock = threading.Lock()
+        self.current = threading.local() # Stage times of the frame each thread is working on
+        self.exportFile = None
+        self.exportWriter = None
+        self.exportFields = None
+        self.buffer = []
+        if enabled and exportPath:
+            self.openExport(exportPath)
+
+    def stage(self, name):
+        # with profiler.stage("matching"): ...
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, name)
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.samples[name].append(seconds)
+        if not hasattr(self.current, "stages"):
+            self.current.stages = {}
+        self.current.stages[name] = self.current.stages.get(name, 0.0) + seconds*1000
+
+    def frameDone(self, countFps=True):
+        # Marks the end of a frame on this thread, its stage times become one exported row.
+        # Only the thread that shows the frames should count them for the fps
+        if not self.enabled:
+            return
+        stages = getattr(self.current, "stages", {})
+        self.current.stages = {}
+        now = time.perf_counter()
+        with self.lock:
+            if countFps:
+                self.frameTimes.append(now)
+            if self.exportFile is not None and stages:
+                self.buffer.append(dict(time=now, thread=threading.current_thread().name, **stages))
+                if len(self.buffer) >= FLUSH_EVERY:
+                    self.flush()
+
+    def reset(self):
+        # Forgets all samples, used to leave out warm-up frames
+        with self.lock:
+            self.samples.clear()
+            self.frameTimes.clear()
+
+    def fps(self):
+        with self.lock:
+            if len(self.frameTimes) < 2:
+                return 0.0
+            return (len(self.frameTimes) - 1)/(self.frameTimes[-1] - self.frameTimes[0])
+
+    def summary(self):
+        # Mean and percentiles in milliseconds of every stage over the rolling window
+        with self.lock:
+            samples = {name: np.array(values)*1000 for name, values in self.samples.items() if values}
+        result = {}
+        for name, values in samples.items():
+            result[name] = {"count": len(values), "mean": float(values.mean())}
+            result[name].update({f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))})
+        return result
+
+    def histogram(self, name, bins=20):
+        # Counts and millisecond bin edges of the rolling samples of a stage
+        with self.lock:
+            values = np.array(self.samples.get(name, ()))*1000
+        return np.histogram(values, bins=bins)
+
+    def drawHud(self, frame):
+        # Writes the rolling stage times onto the frame
+        if not self.enabled:
+            return frame
+        lines = [f"{self.fps():5.1f} fps"]
+        lines += [f"{name}: {stats['mean']:.1f} ms (p95 {stats['p95']:.1f})" for name, stats in self.summary().items()]
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (10, 20 + 18*i), cv2.FONT_HERSHEY_SIMPLEX, 0.5, HUD_COLOUR, 1, cv2.LINE_AA)
+        return frame
+
+    def openExport(self, path):
+        # CSV when the file ends in .csv, JSON lines otherwise
+        self.exportFile = open(path, "w", newline="")
+        self.exportPath = str(path)
+
+    def flush(self):
+        # Called with the lock held
+        if not self.buffer:
+            return
+        if self.exportPath.endswith(".csv"):
+            if self.exportWriter is None:
+                # Without known stages the columns are the stages seen in the first rows
+                stages = self.stages or sorted({k for row in self.buffer for k in row} - {"time", "thread"})
+                self.exportFields = ["time", "thread"] + list(stages)
+                self.exportWriter = csv.DictWriter(self.exportFile, self.exportFields, extrasaction="ignore")
+                self.exportWriter.writeheader()
+            self.exportWriter.writerows(self.buffer)
+        else:
+            self.exportFile.writelines(json.dumps(row) + "\n" for row in self.buffer)
+        self.exportFile.flush()
+        self.buffer = []
+
+    def close(self):
+        with self.lock:
+            if self.exportFile is not None:
+                self.flush()
+                self.exportFile.close()
+                self.exportFile = None
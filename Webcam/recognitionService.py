@@ -0,0 +1,303 @@
+import argparse
+import concurrent.futures
+import cv2
+import json
+import numpy as np
+import os
+import queue
+import signal
+import socketserver
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import shared_memory
+from posterIndex import POSTER_HEIGHT, PosterIndex
+
+# Local poster recognition service: POST an image to /recognise and get the most likely movie_ids back.
+# The poster index is loaded once into shared memory, every worker process reads it from there.
+# Requests arriving close together are grouped into one batch, so a worker quantises all of their
+# descriptors in one pass and the batch only crosses the process boundary once.
+
+INDEX_PATH = "posterIndex.npz"
+PORT = 8990
+BATCH_SIZE = 8
+BATCH_WAIT = 0.005 # Seconds the first request of a batch waits for others to join
+MAX_UPLOAD = 10*1024*1024
+RECOGNISE_AMOUNT = 5
+INDEX_ARRAYS = ("vocabulary", "idf", "wordOffsets", "postingPosters", "postingWeights", "movieIds")
+
+# Set in every worker process by attachIndex
+workerIndex = None
+workerOrb = None
+workerBlocks = []
+
+
+class SharedIndex:
+    # Copies the arrays of a PosterIndex into shared memory blocks that worker processes attach to
+
+    def __init__(self, index):
+        self.branching = index.tree.branching
+        self.posters = len(index.movieIds)
+        self.blocks = []
+        self.specs = {}
+        for name in INDEX_ARRAYS:
+            array = index.tree.vocabulary if name == "vocabulary" else getattr(index, name)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attachBlock(name):
+    # Only the service removes the blocks. Before Python 3.13 attaching always registers the block, but the
+    # workers share the resource tracker of the service, so that registration is the one the service ends
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def attachIndex(specs, branching):
+    # Worker initializer, builds the index on top of the shared arrays without copying them
+    global workerIndex, workerOrb
+    # Ctrl+C and a SIGTERM to the whole process group stop the service, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    arrays = {}
+    for name, (blockName, shape, dtype) in specs.items():
+        block = attachBlock(blockName)
+        workerBlocks.append(block) # The arrays are only valid while their block is open
+        arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+    workerIndex = PosterIndex(
+        arrays["vocabulary"], branching, arrays["idf"], arrays["wordOffsets"],
+        arrays["postingPosters"], arrays["postingWeights"], arrays["movieIds"],
+    )
+    workerOrb = cv2.ORB_create()
+
+def imageDescriptors(data):
+    # ORB descriptors of an encoded image, None when it can not be decoded
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+    # The posters were indexed at this height, larger photos only cost time
+    if image.shape[0] > POSTER_HEIGHT:
+        scaleFactor = POSTER_HEIGHT/image.shape[0]
+        image = cv2.resize(image, (round(image.shape[1]*scaleFactor), POSTER_HEIGHT), interpolation=cv2.INTER_AREA)
+    _, descriptors = workerOrb.detectAndCompute(image, None)
+    return descriptors
+
+def recogniseBatch(images, k):
+    # Runs in a worker, returns the matches of every image or None for images that could not be decoded
+    descriptorsList = [imageDescriptors(data) for data in images]
+    results = workerIndex.queryBatch(descriptorsList, k)
+    return [None if descriptors is None else matches for descriptors, matches in zip(descriptorsList, results)]
+
+
+class Batcher:
+    # Groups requests into batches of up to batchSize, waiting at most batchWait for a batch to fill.
+    # Batches are handed to the pool without waiting, so several can be in flight at once
+
+    def __init__(self, pool, batchSize=BATCH_SIZE, batchWait=BATCH_WAIT):
+        self.pool = pool
+        self.batchSize = batchSize
+        self.batchWait = batchWait
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.batched = 0
+        self.thread = threading.Thread(target=self.run, name="batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, data, k):
+        future = concurrent.futures.Future()
+        self.requests.put((data, k, future))
+        return future
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    def run(self):
+        closing = False
+        while not closing:
+            first = self.requests.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.batchWait
+            while len(batch) < self.batchSize:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+            self.dispatch(batch)
+
+    def dispatch(self, batch):
+        self.batches += 1
+        self.batched += len(batch)
+        # One k for the whole batch, the largest asked for, every request is cut to its own k afterwards
+        k = max(request[1] for request in batch)
+        task = self.pool.submit(recogniseBatch, [request[0] for request in batch], k)
+
+        def resolve(task):
+            try:
+                results = task.result()
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                return
+            for (_, requestK, future), matches in zip(batch, results):
+                future.set_result(None if matches is None else matches[:requestK])
+        task.add_done_callback(resolve)
+
+
+class RecognitionHandler(BaseHTTPRequestHandler):
+    # The server it belongs to has a batcher and the number of posters in the index
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def sendJson(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path == "/healthz":
+            return self.sendJson(200, {"ok": True, "posters": self.server.posters})
+        self.sendJson(404, {"success": False})
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/recognise":
+            return self.sendJson(404, {"success": False})
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self.sendJson(411, {"success": False, "error": "Content-Length required"})
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self.sendJson(400, {"success": False, "error": "bad Content-Length"})
+        if length > MAX_UPLOAD:
+            return self.sendJson(413, {"success": False, "error": "image too large"})
+        try:
+            k = int(urllib.parse.parse_qs(url.query).get("k", [RECOGNISE_AMOUNT])[0])
+        except ValueError:
+            return self.sendJson(400, {"success": False, "error": "k must be a number"})
+        data = self.rfile.read(length)
+
+        start = time.perf_counter()
+        try:
+            matches = self.server.batcher.submit(data, max(k, 1)).result()
+        except Exception as e:
+            self.log_error("recognition failed: %s", e)
+            return self.sendJson(500, {"success": False, "error": "recognition failed"})
+        if matches is None:
+            return self.sendJson(400, {"success": False, "error": "could not decode image"})
+        self.sendJson(200, {
+            "success": True,
+            "matches": [{"movie_id": movieId, "score": score} for movieId, score in matches],
+            "ms": (time.perf_counter() - start)*1000,
+        })
+
+
+class RecognitionServer(ThreadingHTTPServer):
+
+    def __init__(self, address, batcher, posters):
+        self.batcher = batcher
+        self.posters = posters
+        super().__init__(address, RecognitionHandler)
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixRecognitionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path, batcher, posters):
+            self.batcher = batcher
+            self.posters = posters
+            if os.path.exists(path): # Left behind by a previous run
+                os.unlink(path)
+            super().__init__(path, RecognitionHandler)
+
+
+def stopService(signum, frame):
+    raise KeyboardInterrupt
+
+def cleanUp(steps):
+    # Runs every (description, step) even when one fails or a second signal interrupts it
+    for description, step in steps:
+        try:
+            step()
+        except (Exception, KeyboardInterrupt) as e:
+            print(f"Could not {description}: {e!r}")
+
+def closeServer(server):
+    server.shutdown()
+    server.server_close()
+
+def serve(indexPath=INDEX_PATH, host="localhost", port=PORT, socketPath=None, workers=None,
+          batchSize=BATCH_SIZE, batchWait=BATCH_WAIT):
+    index = PosterIndex.load(indexPath)
+    sharedIndex = SharedIndex(index)
+    del index # The workers and the service only need the shared copy
+    pool = concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=attachIndex, initargs=(sharedIndex.specs, sharedIndex.branching)
+    )
+    batcher = Batcher(pool, batchSize, batchWait)
+
+    servers = [RecognitionServer((host, port), batcher, sharedIndex.posters)]
+    print(f"Recognising {sharedIndex.posters} posters on http://{host}:{port}")
+    if socketPath:
+        servers.append(UnixRecognitionServer(socketPath, batcher, sharedIndex.posters))
+        print(f"Also listening on {socketPath}")
+    # Stopping the service the way a process manager does cleans up like Ctrl+C
+    signal.signal(signal.SIGTERM, stopService)
+    threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in servers]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        print("Stopping")
+    finally:
+        # The shared memory goes first, it outlives the process when it is not unlinked. Workers that
+        # are still attached keep their mapping until they exit
+        steps = [("remove the shared index", sharedIndex.close)]
+        steps += [(f"close server {server.server_address}", lambda server=server: closeServer(server)) for server in servers]
+        if socketPath:
+            steps.append(("remove the socket", lambda: os.path.exists(socketPath) and os.unlink(socketPath)))
+        steps += [("stop the batcher", batcher.close), ("stop the workers", pool.shutdown)]
+        cleanUp(steps)
+        print(f"Served {batcher.batched} images in {batcher.batches} batches")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve poster recognition over HTTP and optionally a Unix socket")
+    parser.add_argument("--index", default=INDEX_PATH, help="index built with posterIndex.py build")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--socket", help="also listen on this Unix socket")
+    parser.add_argument("--workers", type=int, help="recognition processes, one per core by default")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--batch-wait", type=float, default=BATCH_WAIT*1000, help="milliseconds to wait for a batch to fill")
+    args = parser.parse_args()
+
+    serve(args.index, args.host, args.port, args.socket, args.workers, args.batch_size, args.batch_wait/1000)
@@ -0,0 +1,159 @@
+import cv2
+import hashlib
+import numpy as np
+import pathlib
+import sys
+
+# Keypoints are stored as rows of (x, y, size, angle, response, octave, class_id)
+KEYPOINT_COLUMNS = 7
+POSTER_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+GRAY_DIR = "gray" # Grayscale copies at POSTER_HEIGHT made by webScraper/posterAssets.py
+# Feature caches are kept here rather than next to the posters, which the server serves as they are
+CACHE_DIR = pathlib.Path(__file__).resolve().parent / "featureCache"
+
+
+def keypointsToArray(keypoints):
+    # Convert cv2.KeyPoint objects to a float array that can be saved with numpy
+    array = np.empty((len(keypoints), KEYPOINT_COLUMNS), dtype=np.float32)
+    for i, kp in enumerate(keypoints):
+        array[i] = (kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id)
+    return array
+
+def arrayToKeypoints(array):
+    # Rebuild cv2.KeyPoint objects from a saved keypoint array
+    return tuple(
+        cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave), int(classId))
+        for x, y, size, angle, response, octave, classId in array
+    )
+
+def orbSettings(orb):
+    # Everything that changes what ORB finds, so a cache made with other settings is not used
+    return (f"nfeatures={orb.getMaxFeatures()},scaleFactor={orb.getScaleFactor():g},nlevels={orb.getNLevels()},"
+            f"edgeThreshold={orb.getEdgeThreshold()},firstLevel={orb.getFirstLevel()},WTA_K={orb.getWTA_K()},"
+            f"scoreType={int(orb.getScoreType())},patchSize={orb.getPatchSize()},fastThreshold={orb.getFastThreshold()}")
+
+def fileDigest(path):
+    # sha256 of the poster file, so a cache is not used for a poster downloaded or re-encoded since
+    return hashlib.sha256(pathlib.Path(path).read_bytes()).hexdigest()
+
+def posterFiles(posterDir):
+    # (movie_id, path) of every poster in a directory, the grayscale copy in GRAY_DIR when there is one
+    # since it is smaller to decode and already at the height features are extracted at
+    posterDir = pathlib.Path(posterDir)
+    for posterPath in sorted(posterDir.iterdir()):
+        if posterPath.suffix.lower() not in POSTER_SUFFIXES:
+            continue
+        grayPath = posterDir / GRAY_DIR / f"{posterPath.stem}.png"
+        yield posterPath.stem, grayPath if grayPath.is_file() else posterPath
+
+def cachePathFor(posterPath, height=None, orb=None, kind="poster", cacheDir=CACHE_DIR):
+    # One cache file per poster file, kind of image, height and ORB settings, e.g.
+    # featureCache/tt0111161.jpg-poster-h480-1a2b3c4d.npz. The hash also covers the poster's directory,
+    # so posters with the same name in different directories do not share a cache
+    posterPath = pathlib.Path(posterPath).resolve()
+    settings = orbSettings(orb if orb is not None else cv2.ORB_create())
+    key = hashlib.sha1(f"{posterPath.parent}|{settings}".encode()).hexdigest()[:8]
+    size = f"h{round(height)}" if height else "full"
+    return pathlib.Path(cacheDir) / f"{posterPath.name}-{kind}-{size}-{key}.npz"
+
+
+class ReferenceTarget:
+    # A poster that camera frames are matched against.
+    # Keypoints and descriptors are computed once and can be cached in an .npz file, see cachePathFor
+
+    def __init__(self, image, cachePath=None, orb=None, source=None):
+        # source identifies the file the image came from, see fileDigest
+        self.image = image
+        self.shape = image.shape[:2]
+        self.cachePath = pathlib.Path(cachePath) if cachePath else None
+        self.source = source
+        self.keypoints = None
+        self.descriptors = None
+        if orb is None:
+            orb = cv2.ORB_create()
+        self.settings = orbSettings(orb)
+
+        if not self.loadCache():
+            self.compute(orb)
+            self.saveCache()
+
+        # The keypoint coordinates as an array, used when placing matches on the frame
+        self.points = keypointsToArray(self.keypoints)[:, :2]
+
+    @classmethod
+    def fromFile(cls, posterPath, height=None, orb=None):
+        # Load a poster from disk, optionally scaled to a fixed height, and cache its features in CACHE_DIR
+        if orb is None:
+            orb = cv2.ORB_create()
+        posterPath = pathlib.Path(posterPath)
+        try:
+            data = posterPath.read_bytes()
+        except OSError:
+            data = b""
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) if data else None
+        if image is None:
+            raise FileNotFoundError(f"Could not read poster {posterPath}")
+        if height:
+            scaleFactor = height/image.shape[0]
+            image = cv2.resize(image, (round(image.shape[1]*scaleFactor), round(height)))
+        source = hashlib.sha256(data).hexdigest()
+        return cls(image, cachePath=cachePathFor(posterPath, height, orb), orb=orb, source=source)
+
+    def compute(self, orb):
+        self.keypoints, self.descriptors = orb.detectAndCompute(self.image, None)
+        if self.descriptors is None: # Blank posters give no features
+            self.descriptors = np.empty((0, 32), dtype=np.uint8)
+
+    def loadCache(self):
+        # Returns True if features for the same source file, image size and ORB settings were found on disk
+        if self.cachePath is None or not self.cachePath.exists():
+            return False
+        try:
+            with np.load(self.cachePath) as data:
+                if tuple(data["shape"]) != tuple(self.shape) or str(data["settings"]) != self.settings:
+                    return False
+                cachedSource = str(data["source"]) if "source" in data.files else None
+                if self.source is not None and cachedSource != self.source:
+                    return False
+                self.keypoints = arrayToKeypoints(data["keypoints"])
+                self.descriptors = data["descriptors"]
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring broken feature cache {self.cachePath}: {e}")
+            return False
+        return True
+
+    def saveCache(self):
+        if self.cachePath is None:
+            return
+        self.cachePath.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            self.cachePath,
+            shape=np.array(self.shape),
+            settings=np.array(self.settings),
+            source=np.array(self.source or ""),
+            keypoints=keypointsToArray(self.keypoints),
+            descriptors=self.descriptors,
+        )
+
+
+def precomputeAll(posterDir, height=None):
+    # Compute and cache the features of every poster in a directory, run once offline
+    orb = cv2.ORB_create()
+    done = 0
+    for _, posterPath in posterFiles(posterDir):
+        try:
+            ReferenceTarget.fromFile(posterPath, height=height, orb=orb)
+        except FileNotFoundError as e:
+            print(e)
+            continue
+        done += 1
+        if done%100 == 0:
+            print(f"Cached features for {done} posters")
+    print(f"Done, cached features for {done} posters in {posterDir}")
+    return done
+
+
+if __name__ == '__main__':
+    posterDir = sys.argv[1] if len(sys.argv) > 1 else "../server/src/posters"
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    precomputeAll(posterDir, height)
@@ -0,0 +1,160 @@
+import cv2
+import numpy as np
+
+# Multi-scale template tracking, searched coarse-to-fine.
+# All scaled templates are made once, every scale is first searched on a downsampled frame and
+# only the best candidates are refined at full resolution in a small window around them.
+
+GRANULARITY_TRACKING = 0.05
+START_FACTOR = 0.7
+END_FACTOR = 0.1
+SPOTS_THRESHOLD = 4
+TOP_CANDIDATES = 30 # Peaks checked for spots on every scale
+COARSE_SCALE = 0.25
+REFINE_CANDIDATES = 3 # Separate coarse candidates refined at full resolution
+REFINE_MARGIN = 2 # Extra pixels searched around a refined candidate
+MIN_COARSE_SIZE = 8
+
+
+def trackingWidths(frameHeight, templateShape, granularity=GRANULARITY_TRACKING):
+    # The template widths the tracker searches, from large to small
+    h_template, w_template = templateShape[:2]
+    if w_template > h_template:
+        start_width = frameHeight
+    else:
+        start_width = w_template/h_template*frameHeight
+    end_width = frameHeight*END_FACTOR
+
+    widths = []
+    current_width = start_width*START_FACTOR
+    factor = 1
+    while current_width > end_width:
+        widths.append(current_width)
+        factor -= granularity
+        current_width = factor*start_width
+    return widths
+
+def scoreMap(res, method):
+    # Match result where higher is always better
+    if method in (cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED):
+        return -res
+    return res
+
+def topPeaks(res, k=TOP_CANDIDATES):
+    # Positions of the k highest values of a match result, found with a partial sort
+    flat = res.ravel()
+    k = min(k, flat.size)
+    idx = np.argpartition(flat, -k)[-k:]
+    ys, xs = np.unravel_index(idx, res.shape)
+    return ys, xs, flat[idx]
+
+def spotsInBoxes(spots, ys, xs, width, height):
+    # Number of spots strictly inside each box with top left corner (xs, ys), spots are rows of (x, y)
+    if len(spots) == 0:
+        return np.zeros(len(ys), dtype=np.int64)
+    spots = np.asarray(spots)
+    spotX, spotY = spots[None, :, 0], spots[None, :, 1]
+    ys, xs = ys[:, None], xs[:, None]
+    inside = (spotY > ys) & (spotY < ys + height) & (spotX > xs) & (spotX < xs + width)
+    return inside.sum(axis=1)
+
+
+class MultiScaleTracker:
+
+    def __init__(self, templateGray, frameHeight, granularity=GRANULARITY_TRACKING, coarseScale=COARSE_SCALE):
+        self.coarseScale = coarseScale
+        h_template, w_template = templateGray.shape[:2]
+        self.sizes = [] # Float (width, height) of every scale, used for the spot boxes
+        self.templates = []
+        self.coarseTemplates = []
+        for width in trackingWidths(frameHeight, templateGray.shape, granularity):
+            height = width/w_template*h_template
+            self.sizes.append((width, height))
+            # Scaled from the original every time so small templates do not lose detail
+            self.templates.append(cv2.resize(templateGray, (int(width), int(height))))
+            coarseSize = (max(MIN_COARSE_SIZE, round(int(width)*coarseScale)),
+                          max(MIN_COARSE_SIZE, round(int(height)*coarseScale)))
+            self.coarseTemplates.append(cv2.resize(templateGray, coarseSize, interpolation=cv2.INTER_AREA))
+
+    def find(self, frameGray, spots, method=cv2.TM_CCOEFF_NORMED, spotsThreshold=SPOTS_THRESHOLD):
+        # Returns (score, x, y, width, height) of the best match with enough spots in it, or None
+        if len(spots) <= spotsThreshold or not self.templates:
+            return None
+        coarseFrame = cv2.resize(frameGray, None, fx=self.coarseScale, fy=self.coarseScale,
+                                 interpolation=cv2.INTER_AREA)
+
+        # Coarse pass over every scale
+        candidates = []
+        for scale, template in enumerate(self.coarseTemplates):
+            if template.shape[0] > coarseFrame.shape[0] or template.shape[1] > coarseFrame.shape[1]:
+                continue
+            res = scoreMap(cv2.matchTemplate(coarseFrame, template, method), method)
+            ys, xs, scores = topPeaks(res)
+            # Boxes are grown by one coarse pixel so spots close to the edge are not lost
+            slack = 1/self.coarseScale
+            width, height = self.sizes[scale]
+            counts = spotsInBoxes(spots, ys/self.coarseScale - slack, xs/self.coarseScale - slack,
+                                  round(width) + 2*slack, round(height) + 2*slack)
+            good = counts > spotsThreshold
+            candidates += [(score, scale, x, y) for score, x, y in zip(scores[good], xs[good], ys[good])]
+        if not candidates:
+            return None
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        # Refine the best separate candidates at full resolution, on their own and the neighbouring scales
+        best = None
+        margin = round(0.5/self.coarseScale) + REFINE_MARGIN
+        chosen = []
+        for _, scale, x, y in candidates:
+            if len(chosen) == REFINE_CANDIDATES:
+                break
+            if any(abs(scale - s) <= 1 and abs(x - cx) <= 1 and abs(y - cy) <= 1 for s, cx, cy in chosen):
+                continue
+            chosen.append((scale, x, y))
+        refined = set()
+        for scale, x, y in chosen:
+            for neighbour in (scale - 1, scale, scale + 1):
+                if neighbour < 0 or neighbour >= len(self.templates):
+                    continue
+                x0 = max(0, round(x/self.coarseScale) - margin)
+                y0 = max(0, round(y/self.coarseScale) - margin)
+                if (neighbour, x0, y0) in refined:
+                    continue
+                refined.add((neighbour, x0, y0))
+                match = self.refine(frameGray, spots, method, spotsThreshold, neighbour, x0, y0, margin)
+                if match is not None and (best is None or match[0] > best[0]):
+                    best = match
+        return best
+
+    def refine(self, frameGray, spots, method, spotsThreshold, scale, x0, y0, margin):
+        template = self.templates[scale]
+        t_h, t_w = template.shape[:2]
+        window = frameGray[y0:y0 + t_h + 2*margin, x0:x0 + t_w + 2*margin]
+        if window.shape[0] < t_h or window.shape[1] < t_w:
+            return None
+        res = scoreMap(cv2.matchTemplate(window, template, method), method)
+        ys, xs, scores = topPeaks(res)
+        ys, xs = ys + y0, xs + x0
+        width, height = self.sizes[scale]
+        good = spotsInBoxes(spots, ys, xs, round(width), round(height)) > spotsThreshold
+        if not good.any():
+            return None
+        i = np.argmax(np.where(good, scores, -np.inf))
+        return float(scores[i]), int(xs[i]), int(ys[i]), width, height
+
+    def findExhaustive(self, frameGray, spots, method=cv2.TM_CCOEFF_NORMED, spotsThreshold=SPOTS_THRESHOLD):
+        # Full resolution search over every scale, the reference find() is compared against
+        best = None
+        for scale, template in enumerate(self.templates):
+            if template.shape[0] > frameGray.shape[0] or template.shape[1] > frameGray.shape[1]:
+                continue
+            res = scoreMap(cv2.matchTemplate(frameGray, template, method), method)
+            ys, xs, scores = topPeaks(res)
+            width, height = self.sizes[scale]
+            good = spotsInBoxes(spots, ys, xs, round(width), round(height)) > spotsThreshold
+            if not good.any():
+                continue
+            i = np.argmax(np.where(good, scores, -np.inf))
+            if best is None or scores[i] > best[0]:
+                best = (float(scores[i]), int(xs[i]), int(ys[i]), width, height)
+        return best
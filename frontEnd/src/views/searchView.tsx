@@ -130,7 +130,7 @@ export function SearchView({
   // Get poster URL from server or use placeholder
   function getPosterUrl(movieId?: string, title?: string): string {
     if (movieId) {
-      return `http://localhost:8989/api/getPosterById?id=${movieId}`;
+      return `http://localhost:8989/api/getPosterById?id=${movieId}&size=thumb`;
     }
     return getPlaceholderPoster(title || 'N/A');
   }
@@ -8,5 +8,8 @@ const db = new Database("database.db");
 db.pragma("foreign_keys = ON");
 const OMDB_KEY = process.env.OMDB_KEY;
 const MAPILLARY_KEY = process.env.MAPILLARY_KEY;
+// Poster recognition service (Webcam/recognitionService.py), over a Unix socket when one is set
+const RECOGNITION_SOCKET = process.env.RECOGNITION_SOCKET;
+const RECOGNITION_PORT = process.env.RECOGNITION_PORT || 8990;
 console.log(OMDB_KEY);
-export default {db, OMDB_KEY, MAPILLARY_KEY, posterCache, plotCache};
\ No newline at end of file
+export default {db, OMDB_KEY, MAPILLARY_KEY, RECOGNITION_SOCKET, RECOGNITION_PORT, posterCache, plotCache};
\ No newline at end of file
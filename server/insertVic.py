@@ -1,14 +1,14 @@
+import pathlib
 import sqlite3
+import sys
 
-conn = sqlite3.connect('database.db')
+# Adds the VICtorius demo movie and its location, running it again changes nothing.
+# The rows and the upsert are webScraper/demoData.py's, webScraper/seedDatabase.py seeds the rest of the demo data
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "webScraper"))
+from demoData import seedFeatured
 
-cur = conn.cursor()
+conn = sqlite3.connect('database.db')
 conn.execute("PRAGMA foreign_keys=ON")
-
-
-lat, lon = 59.3468917, 18.073541
-
-cur.execute("INSERT INTO movies (id, title, genre, year, runtime, plot) VALUES (?, ?, ?, ?, ?, ?)", ("tt1337", "Absolute Cinema: VICtorius", "Action", "2025", "90","A group of students work late nights trying make their deadlines"))
-
-cur.execute("INSERT INTO locations (id, movie_id, lat, lon, place, info) VALUES (?, ?, ?, ?, ?, ?)", (13371337, "tt1337", lat, lon, "Lindstedtsvägen 5 Stockholm", "Where the headscratching began"))
-conn.commit()
+with conn:
+    seedFeatured(conn)
+conn.close()
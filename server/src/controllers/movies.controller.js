@@ -2,9 +2,10 @@ import { Router } from "express";
 import values from "../../db.js";
 import path from "path";
 import fs from "fs/promises";
+import http from "http";
 import { fileURLToPath } from "url";
 
-const {db, OMDB_KEY, MAPILLARY_KEY, posterCache, plotCache} = values;
+const {db, OMDB_KEY, MAPILLARY_KEY, RECOGNITION_SOCKET, RECOGNITION_PORT, posterCache, plotCache} = values;
 
 const mapRouter = Router();
 
@@ -57,13 +58,30 @@ mapRouter.get("/getGenres", (req, res) => {
   return res.json({ success: true, genres });
 });
 
+// The spatial index is built by webScraper/convertToDatabase.py, databases made before it (like the
+// prebuilt download) do not have it and are scanned with the bounding box instead
+const hasSpatialIndex = () =>
+  db.prepare("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'locations_rtree'").get() !== undefined;
+
 mapRouter.get("/getClose", (req, res) => {
-  const location = req.query.coordinates;
-  const distance = req.query.distance;
+  // Either coordinates=lat&coordinates=lon or coordinates=lat,lon as the frontend sends it
+  const coordinates = req.query.coordinates;
+  const parts = Array.isArray(coordinates) ? coordinates : typeof coordinates === "string" ? coordinates.split(",") : [];
+  const location = parts.map((part) => (typeof part === "string" && part.trim() !== "" ? Number(part) : NaN));
+  const distance = Number(req.query.distance);
+  if (location.length !== 2 || !location.every(Number.isFinite) || !Number.isFinite(distance) || distance < 0) {
+    return res.status(400).json({
+      success: false,
+      error: "expected coordinates as a latitude and a longitude and a distance that is not negative",
+    });
+  }
+  // Through the spatial index when there is one (webScraper/locationSearch.py has lookups in metres)
+  const query = hasSpatialIndex()
+    ? `SELECT l.* FROM locations_rtree r JOIN locations l ON l.id = r.id
+       WHERE r.maxLat >= ? AND r.minLat <= ? AND r.maxLon >= ? AND r.minLon <= ?`
+    : "SELECT * FROM locations WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?";
   const places = db
-    .prepare(
-      "SELECT * FROM locations WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?",
-    )
+    .prepare(query)
     .all(
       location[0] - distance,
       location[0] + distance,
@@ -193,11 +211,29 @@ mapRouter.get("/getByLocation", (req, res) => {
 
 
 
+// Smaller versions of the posters made by webScraper/posterAssets.py: directory, extension and type
+const POSTER_SIZES = {
+  thumb: ["thumb", ".jpg", "image/jpeg"],
+  web: ["web", ".webp", "image/webp"],
+};
+
 mapRouter.get("/getPosterById", async (req, res) => {
   const id = req.query.id;
-  const p = path.join(POSTERS_DIR, `${id}.${"jpg"}`);
+  let p = path.join(POSTERS_DIR, `${id}.${"jpg"}`);
+  let type = "image/jpeg";
+  if (Object.hasOwn(POSTER_SIZES, req.query.size)) {
+    const [dir, extension, sizeType] = POSTER_SIZES[req.query.size];
+    const sized = path.join(POSTERS_DIR, dir, `${id}${extension}`);
+    try {
+      await fs.access(sized);
+      p = sized;
+      type = sizeType;
+    } catch {
+      // Not made yet, the full poster is sent instead
+    }
+  }
 
-  res.set("Content-Type", "image/jpeg");
+  res.set("Content-Type", type);
   res.set("Cache-Control", "public, max-age=604800, immutable");
 
   await fs.access(p);
@@ -205,5 +241,36 @@ mapRouter.get("/getPosterById", async (req, res) => {
   return res.sendFile(p);
 });
 
+// Which film is in this photo? The image is the raw request body, it is streamed to the recognition service
+mapRouter.post("/recognise", (req, res) => {
+  const headers = { "Content-Type": req.headers["content-type"] || "application/octet-stream" };
+  if (req.headers["content-length"]) {
+    headers["Content-Length"] = req.headers["content-length"];
+  }
+  const target = RECOGNITION_SOCKET
+    ? { socketPath: RECOGNITION_SOCKET }
+    : { host: "localhost", port: RECOGNITION_PORT };
+
+  const proxy = http.request(
+    {
+      ...target,
+      method: "POST",
+      path: `/recognise?k=${encodeURIComponent(req.query.k || 5)}`,
+      headers,
+    },
+    (response) => {
+      res.status(response.statusCode);
+      res.set("Content-Type", "application/json");
+      response.pipe(res);
+    },
+  );
+  proxy.on("error", (err) => {
+    console.log("Recognition service unavailable", err.message);
+    if (!res.headersSent) {
+      res.status(502).json({ success: false });
+    }
+  });
+  req.pipe(proxy);
+});
 
 export default mapRouter;
@@ -1,85 +1,56 @@
-import time, requests
+import argparse
+import asyncio
+import time
 import pickle as pk
-
-with open("locationDataset.pk", 'rb') as f:
+from geocodeCache import CACHE_PATH, GeocodeCache
+from geocodeJournal import JOURNAL_PATH, GeocodeJournal
+from geocoder import PROVIDERS, Geocoder
+
+# Adds coordinates to every location scraped into locationDataset.pk and saves them to cordinates.pk.
+# Every location is written to the journal as soon as it is done, so a run that stops can be started
+# again and only geocodes what is left, the same goes for new locations after a new scrape.
+
+parser = argparse.ArgumentParser(description="Geocode the scraped filming locations")
+parser.add_argument("--provider", choices=PROVIDERS, default="nominatim",
+                    help="local is geocodeStandIn.py, for trying the engine without the real service")
+parser.add_argument("--input", default="locationDataset.pk")
+parser.add_argument("--output", default="cordinates.pk")
+parser.add_argument("--cache", default=CACHE_PATH, help="SQLite file with the answers of earlier runs")
+parser.add_argument("--no-cache", action="store_true", help="ask the provider about every place again")
+parser.add_argument("--journal", default=JOURNAL_PATH, help="JSON lines file with every geocoded location")
+parser.add_argument("--fresh", action="store_true", help="forget the journal and geocode every location again")
+parser.add_argument("--retry-not-found", action="store_true", help="also geocode locations that were not found before")
+parser.add_argument("--export-only", action="store_true", help="only write the output from the journal")
+args = parser.parse_args()
+
+with open(args.input, 'rb') as f:
     locationSet = pk.load(f)
 
-
-
-session = requests.Session()
-session.headers.update({
-    "User-Agent": "morca-moths-locationfinder/0.1 (+mailto:Osvalds@kth.se)",
-    "Referer": "https://github.com/poskusen" 
-})
-
-newLocationCoordinates = {}
-iter = 0
-found = 0
-
-for title in locationSet.keys():
-    locations = locationSet[title]
-    newLocations = []
-    for location in locations:
-        q = location[0]
-        r = session.get(
-            "https://nominatim.openstreetmap.org/search",
-            params={
-                "q": q,
-                "format": "json",
-                "limit": 1,
-                "addressdetails": 0,
-                "email": "osvalds@kth.se",
-            },
-            timeout=15,
-        )
-        if r.status_code == 429:
-            time.sleep(2.5)
-            r = session.get(r.request.url, timeout=15)
-        data = r.json()
-        time.sleep(1.1)
-        if not data:
-            try: 
-                nofound = True
-                itery = 1
-                components = q.split(",")
-                while nofound and itery < 6:
-                    newq = ','.join(components[itery:])
-                    r = session.get(
-                        "https://nominatim.openstreetmap.org/search",
-                        params={
-                            "q": newq,
-                            "format": "json",
-                            "limit": 1,
-                            "addressdetails": 0,
-                            "email": "osvalds@kth.se",
-                        },
-                        timeout=15,
-                    )
-                    time.sleep(1.1)
-                    data = r.json()
-                    if not data:
-                        itery += 1
-                    else: 
-                        location.append(data[0]["display_name"])
-                        location.append([float(data[0]["lat"]), float(data[0]["lon"])])
-                        newLocations.append(location)
-                        nofound = False
-                        found += 1
-            except Exception as e:
-                print(e)
-            if itery >= 6:
-                print(f"could not find {q}")
-        else:
-            if found%10 == 0:
-                print(f"found {found} places")
-            location.append(data[0]["display_name"])
-            location.append([float(data[0]["lat"]), float(data[0]["lon"])])
-            newLocations.append(location)
-            found += 1
-    newLocationCoordinates[title] = newLocations
-    iter += 1
-    print(f"Done with {iter}/{len(locationSet)} titles")
-
-
-with open("cordinates.pk", 'wb') as f:
-    pk.dump(newLocationCoordinates, f)
\ No newline at end of file
+journal = GeocodeJournal(args.journal, fresh=args.fresh)
+pending = {} if args.export_only else journal.pending(locationSet, args.retry_not_found)
+total = sum(len(locations) for locations in locationSet.values())
+print(f"{sum(len(locations) for locations in pending.values())} of {total} locations left to geocode")
+
+cache = None if args.no_cache or not pending else GeocodeCache(args.cache)
+try:
+    if pending:
+        if cache is not None:
+            print(f"Removed {cache.purgeExpired()} expired places from the cache")
+        geocoder = Geocoder(PROVIDERS[args.provider](), cache=cache)
+        start = time.perf_counter()
+        asyncio.run(geocoder.geocodeLocations(pending, onResult=journal.write))
+        elapsed = time.perf_counter() - start
+
+        stats = geocoder.stats
+        print(f"found {stats['found']} places with {stats['requests']} requests in {elapsed:.1f} s "
+              f"({stats['cached']} cached, {stats['shared']} shared, {stats['retries']} retries, {stats['rateLimited']} rate limited, {stats['failed']} failed)")
+except KeyboardInterrupt:
+    print("Stopped, run again to continue where this run stopped")
+finally:
+    # Also after Ctrl+C, everything done so far is kept
+    journal.close()
+    if cache is not None:
+        cache.close()
+    with open(args.output, 'wb') as f:
+        pk.dump(journal.export(locationSet), f)
+    print(f"Saved {args.output}")
@@ -1,52 +1,139 @@
+import argparse
 import sqlite3
-import polars as pl
 import pickle as pk
+import time
+from locationSearch import createSpatialIndex
+from titleIndex import TitleIndex
 
-conn = sqlite3.connect('database.db')
+# Loads the geocoded locations (cordinates.pk) and their movies into the server's database.
+# Rows are staged with executemany in large transactions and merged with upserts, so loading the same
+# data again updates it instead of failing or duplicating it, and the indexes (including the spatial index
+# locationSearch.py queries) are built once the rows are in.
 
+DATABASE_PATH = "database.db"
+COORDINATES_PATH = "cordinates.pk"
+MOVIES_PER_TRANSACTION = 5000
+CACHE_SIZE_KB = 64*1024
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL", # With WAL only a power loss can lose the last transactions, never corrupt the file
+    f"PRAGMA cache_size=-{CACHE_SIZE_KB}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS locations_movie_id ON locations(movie_id)",
+)
 
-titlesFrame = pl.read_csv(r"../title.basics.tsv", separator = "\t", null_values="\\N", quote_char=None)
 
-with open("cordinates.pk", "rb") as f:
-    locations = pk.load(f)
+def connect(path=DATABASE_PATH):
+    conn = sqlite3.connect(path)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
 
-cur = conn.cursor()
-conn.execute("PRAGMA foreign_keys=ON")
+def createTables(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS movies(id TEXT PRIMARY KEY, title TEXT NOT NULL, genre TEXT, year TEXT, runTime TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS locations(id INTEGER PRIMARY KEY, movie_id TEXT NOT NULL, lat REAL, lon REAL, place TEXT, info TEXT, FOREIGN KEY(movie_id) REFERENCES movies(id))")
 
-cur.execute("CREATE TABLE IF NOT EXISTS movies(id TEXT PRIMARY KEY, title TEXT NOT NULL, genre TEXT, year TEXT, runTime TEXT)")
+def createIndexes(conn):
+    with conn:
+        for index in INDEXES:
+            conn.execute(index)
+    createSpatialIndex(conn)
+    with conn:
+        conn.execute("ANALYZE")
 
-cur.execute("CREATE TABLE IF NOT EXISTS locations(id INTEGER PRIMARY KEY, movie_id TEXT NOT NULL, lat REAL, lon REAL, place TEXT, info TEXT, FOREIGN KEY(movie_id) REFERENCES movies(id))")
-iter = 0
-for id in locations:
-    titleFrame = titlesFrame.filter(pl.col("tconst") == id)
-    title = titleFrame.select("primaryTitle").to_series().to_list()[0]
-    genre = titleFrame.select("genres").to_series().to_list()[0].split(",")[0]
-    year = titleFrame.select("startYear").to_series().to_list()[0]
-    runtime = titleFrame.select("runtimeMinutes").to_series().to_list()[0]
-    cur.execute(
-        "INSERT INTO movies (id, title, genre, year, runTime) VALUES (?, ?, ?, ?, ?)",
-        (id, title, genre, year, runtime)
-    )
+def movieRow(id, titleRow):
+    genre = titleRow["genres"].split(",")[0] if titleRow["genres"] else None
+    return id, titleRow["primaryTitle"], genre, titleRow["startYear"], titleRow["runtimeMinutes"]
 
-    allLocations = locations[id]
+def locationRows(id, allLocations):
+    # A location is identified by its movie, place and description, a repeated one keeps its last coordinates
+    rows = {}
     for location in allLocations:
-        place = location[0]
-        coordinates = location[-1]
-        lat = coordinates[0]
-        lon = coordinates[1]
-        info = location[1]
-        cur.execute(
-            "INSERT INTO locations (movie_id, lat, lon, place, info) VALUES (?, ?, ?, ?, ?)",
-            (id, lat, lon, place, info)
+        lat, lon = location[-1]
+        place, info = location[0], location[1] or ""
+        rows[(id, place, info)] = (id, lat, lon, place, info)
+    return rows.values()
+
+def loadChunk(conn, movies, locations, merge):
+    # One transaction: movies are upserted directly. With merge, locations go through a staging table so that
+    # the ones already in the database keep their id (and visits) and only get their coordinates updated
+    with conn:
+        conn.executemany(
+            "INSERT INTO movies (id, title, genre, year, runTime) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET title = excluded.title, genre = excluded.genre, "
+            "year = excluded.year, runTime = excluded.runTime",
+            movies
+        )
+        if not merge:
+            conn.executemany("INSERT INTO locations (movie_id, lat, lon, place, info) VALUES (?, ?, ?, ?, ?)", locations)
+            return len(locations)
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS stagedLocations(movie_id TEXT, lat REAL, lon REAL, place TEXT, info TEXT)")
+        conn.execute("DELETE FROM stagedLocations")
+        conn.executemany("INSERT INTO stagedLocations (movie_id, lat, lon, place, info) VALUES (?, ?, ?, ?, ?)", locations)
+        conn.execute(
+            "UPDATE locations SET lat = s.lat, lon = s.lon FROM stagedLocations s "
+            "WHERE locations.movie_id = s.movie_id AND locations.place = s.place AND locations.info = s.info"
         )
-    conn.commit()
-    iter += 1
-    print("Done with: " +  str(iter/len(locations)) + "%")
+        inserted = conn.execute(
+            "INSERT INTO locations (movie_id, lat, lon, place, info) "
+            "SELECT movie_id, lat, lon, place, info FROM stagedLocations s WHERE NOT EXISTS "
+            "(SELECT 1 FROM locations l WHERE l.movie_id = s.movie_id AND l.place = s.place AND l.info = s.info)"
+        ).rowcount
+    return inserted
 
-print("Finished")
-        
+def loadDatabase(conn, locations, titles):
+    # locations maps tconst to the geocoded locations, titles maps tconst to its row of the title index.
+    # Returns (movies, locations staged, new locations)
+    createTables(conn)
+    # Movies of a load never repeat, so only locations that were in the database before can clash. Merging
+    # those needs the movie index, a fresh load inserts straight away and builds it once at the end
+    merge = conn.execute("SELECT EXISTS (SELECT 1 FROM locations)").fetchone()[0]
+    if merge:
+        createIndexes(conn)
+    movies, staged, skipped = [], [], 0
+    movieCount = stagedCount = inserted = 0
+    for id, allLocations in locations.items():
+        if id not in titles:
+            skipped += 1
+            continue
+        movies.append(movieRow(id, titles[id]))
+        staged.extend(locationRows(id, allLocations))
+        if len(movies) >= MOVIES_PER_TRANSACTION:
+            inserted += loadChunk(conn, movies, staged, merge)
+            movieCount, stagedCount = movieCount + len(movies), stagedCount + len(staged)
+            movies, staged = [], []
+            print(f"Done with {movieCount}/{len(locations)} movies")
+    if movies:
+        inserted += loadChunk(conn, movies, staged, merge)
+        movieCount, stagedCount = movieCount + len(movies), stagedCount + len(staged)
+    if skipped:
+        print(f"Skipped {skipped} movies that are not in the title index")
+    return movieCount, stagedCount, inserted
 
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load the geocoded locations and their movies into the database")
+    parser.add_argument("--database", default=DATABASE_PATH)
+    parser.add_argument("--coordinates", default=COORDINATES_PATH)
+    args = parser.parse_args()
 
+    with open(args.coordinates, "rb") as f:
+        locations = pk.load(f)
 
+    # Every movie of the dataset in one join
+    titles = {row["tconst"]: row for row in TitleIndex().lookupIds(locations, ["tconst", "primaryTitle", "genres", "startYear", "runtimeMinutes"]).iter_rows(named=True)}
 
+    conn = connect(args.database)
+    start = time.perf_counter()
+    movieCount, locationCount, inserted = loadDatabase(conn, locations, titles)
+    loaded = time.perf_counter() - start
+    createIndexes(conn)
+    indexed = time.perf_counter() - start - loaded
+    rows = movieCount + locationCount
+    print(f"Loaded {movieCount} movies and {locationCount} locations ({inserted} new) in {loaded:.2f} s, "
+          f"{rows/max(loaded, 1e-9):.0f} rows/s, indexes built in {indexed:.2f} s")
+    conn.close()
+    print("Finished")
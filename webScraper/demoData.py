@@ -0,0 +1,34 @@
+# Demo data shared by the scripts that write it and the ones that have to tell it apart from real data:
+# the featured movies such as VICtorius, added by seedDatabase.py and server/insertVic.py, and the marker
+# of synthetic ids. Kept free of heavy imports so any script can use it.
+
+SYNTHETIC = "-syn" # Synthetic movie ids are the real id with this and a copy number appended
+FEATURED_MOVIES = [
+    ("tt1337", "Absolute Cinema: VICtorius", "Action", "2025", "90", "A group of students work late nights trying make their deadlines"),
+]
+FEATURED_LOCATIONS = [
+    (13371337, "tt1337", 59.3468917, 18.073541, "Lindstedtsvägen 5 Stockholm", "Where the headscratching began"),
+]
+
+
+def addColumn(conn, table, column):
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column.split()[0] not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+
+def seedFeatured(conn):
+    # Upserted, so running it again changes nothing
+    addColumn(conn, "movies", "plot TEXT")
+    conn.executemany(
+        "INSERT INTO movies (id, title, genre, year, runTime, plot) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET title = excluded.title, genre = excluded.genre, year = excluded.year, "
+        "runTime = excluded.runTime, plot = excluded.plot",
+        FEATURED_MOVIES
+    )
+    conn.executemany(
+        "INSERT INTO locations (id, movie_id, lat, lon, place, info) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET movie_id = excluded.movie_id, lat = excluded.lat, lon = excluded.lon, "
+        "place = excluded.place, info = excluded.info",
+        FEATURED_LOCATIONS
+    )
+    return len(FEATURED_MOVIES) + len(FEATURED_LOCATIONS)
@@ -0,0 +1,161 @@
+import os
+import pickle as pk
+import queue
+import threading
+from selenium.common.exceptions import WebDriverException
+
+# A pool of long lived browsers fed from a work queue.
+# Every browser accepts the cookie consent once when it starts, the first one saves its cookies so the
+# others (and later runs) start with them, and a browser that crashes is started again for the next try.
+
+CONSENT_URL = "https://www.imdb.com/"
+COOKIE_PATH = "imdbCookies.pk"
+RESTARTS = 2 # Times an item is tried again on a new browser after its browser crashed
+CONSENT_CHECK_TIMEOUT = 2 # Seconds to look for the consent dialog when the saved cookies should have accepted it
+COOKIE_FIELDS = ("name", "value", "domain", "path", "secure", "httpOnly", "expiry")
+
+
+class PooledDriver:
+    # One browser of the pool, started the first time it is needed
+
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+        self.driver = None
+        self.restarts = 0
+        self.done = 0
+
+    def get(self):
+        if self.driver is None:
+            driver = self.pool.makeDriver()
+            try:
+                self.pool.prepare(driver)
+            except Exception:
+                driver.quit()
+                raise
+            self.driver = driver
+        return self.driver
+
+    def alive(self):
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            # A dead browser can also fail below Selenium, with urllib3 connection errors
+            return False
+
+    def restart(self):
+        self.quit()
+        self.restarts += 1
+
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+
+class DriverPool:
+
+    def __init__(self, size, makeDriver, acceptConsent, consentUrl=CONSENT_URL, cookiePath=COOKIE_PATH):
+        # makeDriver() starts a browser, acceptConsent(driver, timeout) clicks the consent dialog and returns
+        # if it was there, timeout is None for its own default
+        self.makeDriver = makeDriver
+        self.acceptConsent = acceptConsent
+        self.consentUrl = consentUrl
+        self.cookiePath = cookiePath
+        self.cookies = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.workers = [PooledDriver(self, f"browser {i}") for i in range(size)]
+
+    def loadCookies(self):
+        if self.cookies is None and self.cookiePath and os.path.exists(self.cookiePath):
+            with open(self.cookiePath, "rb") as f:
+                self.cookies = pk.load(f)
+
+    def prepare(self, driver):
+        # Only one browser at a time, so consent is clicked once and the others get its cookies
+        with self.lock:
+            driver.get(self.consentUrl)
+            self.loadCookies()
+            timeout = None
+            if self.cookies is not None:
+                for cookie in self.cookies:
+                    try:
+                        driver.add_cookie({key: cookie[key] for key in COOKIE_FIELDS if key in cookie})
+                    except WebDriverException:
+                        pass
+                driver.refresh()
+                timeout = CONSENT_CHECK_TIMEOUT # Saved cookies can expire, then the dialog is back
+            if not self.acceptConsent(driver, timeout):
+                return
+            self.cookies = driver.get_cookies()
+            if self.cookiePath:
+                with open(self.cookiePath, "wb") as f:
+                    pk.dump(self.cookies, f)
+
+    def map(self, task, items):
+        # Runs task(driver, item) for every item on the browsers of the pool.
+        # Yields (item, result, error) in the order they finish, error is None when the task worked
+        items = list(items)
+        work = queue.Queue()
+        for item in items:
+            work.put(item)
+        results = queue.Queue()
+        threads = [
+            threading.Thread(target=self.run, args=(worker, task, work, results), name=worker.name, daemon=True)
+            for worker in self.workers[:max(1, min(len(self.workers), len(items)))]
+        ]
+        self.stopping.clear()
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in items:
+                yield results.get()
+        finally:
+            # Workers finish the item they are on and stop
+            self.stopping.set()
+            for thread in threads:
+                thread.join()
+
+    def run(self, worker, task, work, results):
+        while not self.stopping.is_set():
+            try:
+                item = work.get_nowait()
+            except queue.Empty:
+                return
+            result, error = None, None
+            try:
+                for attempt in range(RESTARTS + 1):
+                    try:
+                        result, error = task(worker.get(), item), None
+                        break
+                    except Exception as e:
+                        error = e
+                        if worker.driver is not None and worker.alive():
+                            break # The page went wrong, not the browser
+                        print(f"{worker.name} crashed on {item}, starting a new browser")
+                        worker.restart()
+            except Exception as e:
+                error = e
+            finally:
+                # map() waits for one result per item, whatever went wrong
+                worker.done += 1
+                results.put((item, result, error))
+
+    def stats(self):
+        return {worker.name: {"done": worker.done, "restarts": worker.restarts} for worker in self.workers}
+
+    def close(self):
+        for worker in self.workers:
+            worker.quit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,81 @@
+import re
+import sqlite3
+import time
+import unicodedata
+
+# Persistent cache of geocoding answers in SQLite, shared by every run of the geocoder.
+# Queries are normalised before they become keys, so "London, England, UK" and " london ,England,UK"
+# are one entry. Places that were not found are cached too, for a shorter time than places that were.
+
+CACHE_PATH = "geocodeCache.db"
+TTL = 180*24*3600 # Seconds a found place is trusted
+NEGATIVE_TTL = 14*24*3600 # Seconds a place that was not found stays not found
+
+
+def normaliseQuery(query):
+    # Same unicode form, case folded, single spaces and no spaces around commas or empty parts
+    query = unicodedata.normalize("NFKC", query).casefold()
+    parts = (re.sub(r"\s+", " ", part).strip(" .") for part in query.split(","))
+    return ",".join(part for part in parts if part)
+
+
+class GeocodeCache:
+
+    def __init__(self, path=CACHE_PATH, ttl=TTL, negativeTtl=NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS geocodes (
+                provider TEXT NOT NULL,
+                query TEXT NOT NULL,
+                name TEXT,
+                lat REAL,
+                lon REAL,
+                fetched REAL NOT NULL,
+                PRIMARY KEY (provider, query)
+            )
+        """)
+        self.connection.commit()
+
+    def get(self, provider, key):
+        # Returns (True, result) for a cached answer, result is None for a place that was not found,
+        # and (False, None) when the query has to be sent
+        row = self.connection.execute(
+            "SELECT name, lat, lon, fetched FROM geocodes WHERE provider = ? AND query = ?", (provider, key)
+        ).fetchone()
+        if row is None:
+            return False, None
+        name, lat, lon, fetched = row
+        if time.time() - fetched > (self.ttl if name is not None else self.negativeTtl):
+            return False, None
+        return True, None if name is None else (name, [lat, lon])
+
+    def put(self, provider, key, result):
+        name, (lat, lon) = result if result is not None else (None, (None, None))
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO geocodes (provider, query, name, lat, lon, fetched) VALUES (?, ?, ?, ?, ?, ?)",
+                (provider, key, name, lat, lon, time.time()),
+            )
+
+    def purgeExpired(self):
+        now = time.time()
+        with self.connection:
+            removed = self.connection.execute(
+                "DELETE FROM geocodes WHERE fetched < ? - CASE WHEN name IS NULL THEN ? ELSE ? END",
+                (now, self.negativeTtl, self.ttl),
+            ).rowcount
+        return removed
+
+    def stats(self):
+        found, notFound = self.connection.execute(
+            "SELECT COUNT(name), COUNT(*) - COUNT(name) FROM geocodes"
+        ).fetchone()
+        return {"found": found, "notFound": notFound}
+
+    def close(self):
+        self.connection.close()
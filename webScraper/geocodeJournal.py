@@ -0,0 +1,102 @@
+import json
+import os
+import time
+
+# Append-only journal of geocoded locations, one JSON line per location as soon as it is done.
+# A run that stops halfway loses at most the last unflushed batch, and the next run only geocodes what
+# the journal does not have yet. cordinates.pk is exported from the journal.
+
+JOURNAL_PATH = "cordinates.jsonl"
+FLUSH_EVERY = 50 # Records buffered before they are written
+FLUSH_INTERVAL = 10.0 # Seconds a record waits at most
+
+
+def locationKey(title, location):
+    # A location is its title, place and scene description, so a re-scrape that reorders them still matches
+    return title, location[0], location[1] if len(location) > 1 else ""
+
+
+class GeocodeJournal:
+
+    def __init__(self, path=JOURNAL_PATH, fresh=False):
+        self.path = path
+        self.records = {} # Latest record of every location key
+        if fresh and os.path.exists(path):
+            os.remove(path)
+        elif os.path.exists(path):
+            self.load()
+        self.file = open(path, "a", encoding="utf-8")
+        self.buffer = []
+        self.lastFlush = time.monotonic()
+
+    def load(self):
+        # Reads every complete record, a last line cut off by a crash is removed
+        goodOffset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unfinished line")
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.records[(record["title"], record["place"], record["description"])] = record
+                goodOffset += len(line)
+        if goodOffset < os.path.getsize(self.path):
+            print(f"Removing an unfinished record at the end of {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(goodOffset)
+
+    def status(self, title, location):
+        record = self.records.get(locationKey(title, location))
+        return record["status"] if record is not None else None
+
+    def pending(self, locationSet, retryNotFound=False):
+        # The titles and locations that still have to be geocoded: new ones, ones that failed and,
+        # with retryNotFound, ones that were not found
+        done = {"found"} if retryNotFound else {"found", "notFound"}
+        pending = {}
+        for title, locations in locationSet.items():
+            left = [location for location in locations if self.status(title, location) not in done]
+            if left:
+                pending[title] = left
+        return pending
+
+    def write(self, title, location, result, status):
+        titleKey, place, description = locationKey(title, location)
+        record = {
+            "title": titleKey,
+            "place": place,
+            "description": description,
+            "status": status,
+            "name": result[0] if result is not None else None,
+            "coordinates": result[1] if result is not None else None,
+            "time": time.time(),
+        }
+        self.records[(titleKey, place, description)] = record
+        self.buffer.append(json.dumps(record) + "\n")
+        if len(self.buffer) >= FLUSH_EVERY or time.monotonic() - self.lastFlush > FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.writelines(self.buffer)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.buffer = []
+        self.lastFlush = time.monotonic()
+
+    def export(self, locationSet):
+        # The found locations of every title in the layout of cordinates.pk: [place, description, name, [lat, lon]]
+        coordinates = {}
+        for title, locations in locationSet.items():
+            coordinates[title] = []
+            for location in locations:
+                record = self.records.get(locationKey(title, location))
+                if record is not None and record["status"] == "found":
+                    coordinates[title].append(list(location) + [record["name"], record["coordinates"]])
+        return coordinates
+
+    def close(self):
+        self.flush()
+        self.file.close()
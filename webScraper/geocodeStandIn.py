@@ -0,0 +1,104 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from geocodeCache import normaliseQuery
+
+# Local stand-in for the Nominatim search API, to run the geocoder against without touching the real service.
+# Places get made-up but stable coordinates, queries with too many parts are "not found" so the fallbacks
+# are used, and requests above the rate limit get a 429 like the real thing. The first badAnswers requests
+# get an HTML page instead of JSON, like a proxy or captive portal would send.
+
+PORT = 8991
+RATE = 50 # Requests per second before answering 429
+MAX_COMPONENTS = 3 # Queries with more comma separated parts than this are not found
+BAD_ANSWER = b"<html><body>Please log in to continue</body></html>"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def sendJson(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/search":
+            return self.sendJson(404, [])
+        if not self.server.allow():
+            return self.sendJson(429, [], [("Retry-After", "1")])
+        if self.server.badAnswer():
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(BAD_ANSWER)))
+            self.end_headers()
+            return self.wfile.write(BAD_ANSWER)
+        time.sleep(self.server.latency)
+        # Like a real geocoder, spelling and spacing do not change the answer
+        query = normaliseQuery(urllib.parse.parse_qs(url.query).get("q", [""])[0])
+        if not query or query.count(",") >= self.server.maxComponents:
+            return self.sendJson(200, [])
+        digest = hashlib.sha1(query.encode()).digest()
+        lat = int.from_bytes(digest[:4], "big")/2**32*170 - 85
+        lon = int.from_bytes(digest[4:8], "big")/2**32*360 - 180
+        self.sendJson(200, [{"display_name": query.title(), "lat": f"{lat:.7f}", "lon": f"{lon:.7f}"}])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, rate=RATE, latency=0.0, maxComponents=MAX_COMPONENTS, badAnswers=0):
+        super().__init__(address, StandInHandler)
+        self.rate = rate
+        self.latency = latency
+        self.maxComponents = maxComponents
+        self.badAnswers = badAnswers
+        self.requests = []
+        self.limited = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        # Sliding one second window, like a provider counting requests per client
+        with self.lock:
+            now = time.monotonic()
+            self.requests = [t for t in self.requests if now - t < 1]
+            if len(self.requests) >= self.rate:
+                self.limited += 1
+                return False
+            self.requests.append(now)
+            return True
+
+    def badAnswer(self):
+        with self.lock:
+            if self.badAnswers <= 0:
+                return False
+            self.badAnswers -= 1
+            return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stand-in Nominatim server for testing the geocoder")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--rate", type=float, default=RATE, help="requests per second before answering 429")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every answer takes")
+    parser.add_argument("--bad-answers", type=int, default=0, help="requests answered with an HTML page first")
+    args = parser.parse_args()
+
+    server = StandInServer(("localhost", args.port), args.rate, args.latency, badAnswers=args.bad_answers)
+    print(f"Stand-in geocoder on http://localhost:{args.port}/search")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Answered 429 to {server.limited} requests")
@@ -0,0 +1,210 @@
+import asyncio
+import collections
+import random
+import requests
+from geocodeCache import normaliseQuery
+from tokenBucket import TokenBucket
+
+# Concurrent geocoding within the rate limit of a provider.
+# Requests wait for a token from a token bucket instead of sleeping a fixed time, failed and rate limited
+# requests back off exponentially with jitter, and the shorter fallback queries for a place that was not
+# found are sent together, so a run takes about as long as the provider's rate allows.
+# With a GeocodeCache, answers from earlier runs are used before anything is sent.
+
+USER_AGENT = "morca-moths-locationfinder/0.1 (+mailto:Osvalds@kth.se)"
+REFERER = "https://github.com/poskusen"
+EMAIL = "osvalds@kth.se"
+TIMEOUT = 15
+RETRIES = 4
+BACKOFF_BASE = 1.0 # Seconds before the first retry, doubled every attempt
+BACKOFF_CAP = 60.0
+FALLBACKS = 5 # Times the first part of the query is left out when a place is not found
+CONCURRENCY = 8 # Requests in flight at once, the token bucket decides how often they start
+LOCATIONS_IN_FLIGHT = 16 # Locations started at once, so they finish one after another instead of all at the end
+
+
+class GeocodeError(Exception):
+    # A query that got no answer, as opposed to an answer that the place was not found
+    pass
+
+
+class NominatimProvider:
+    # OpenStreetMap Nominatim, or anything speaking its search API such as geocodeStandIn.py
+
+    def __init__(self, url="https://nominatim.openstreetmap.org/search", rate=1.0, burst=1, name="nominatim"):
+        self.name = name # Answers are cached per provider name
+        self.url = url
+        self.rate = rate # The usage policy allows one request per second
+        self.burst = burst
+
+    def request(self, session, query):
+        return session.get(
+            self.url,
+            params={"q": query, "format": "json", "limit": 1, "addressdetails": 0, "email": EMAIL},
+            timeout=TIMEOUT,
+        )
+
+    def parse(self, data):
+        # (display name, [lat, lon]) of the first result, None when nothing was found
+        if not data:
+            return None
+        return data[0]["display_name"], [float(data[0]["lat"]), float(data[0]["lon"])]
+
+
+class PhotonProvider:
+    # Komoot's Photon, also built on OpenStreetMap data but answering in GeoJSON
+
+    name = "photon"
+
+    def __init__(self, url="https://photon.komoot.io/api", rate=1.0, burst=1):
+        self.url = url
+        self.rate = rate
+        self.burst = burst
+
+    def request(self, session, query):
+        return session.get(self.url, params={"q": query, "limit": 1}, timeout=TIMEOUT)
+
+    def parse(self, data):
+        features = data.get("features") if data else None
+        if not features:
+            return None
+        properties = features[0]["properties"]
+        parts = [properties.get(key) for key in ("name", "city", "state", "country")]
+        lon, lat = features[0]["geometry"]["coordinates"]
+        return ", ".join(part for part in parts if part), [float(lat), float(lon)]
+
+
+PROVIDERS = {
+    "nominatim": NominatimProvider,
+    "photon": PhotonProvider,
+    # geocodeStandIn.py, fast enough that runs against it only test the engine
+    "local": lambda: NominatimProvider("http://localhost:8991/search", rate=50, burst=5, name="local"),
+}
+
+
+class Geocoder:
+
+    def __init__(self, provider, concurrency=CONCURRENCY, retries=RETRIES, cache=None):
+        self.provider = provider
+        self.cache = cache
+        self.bucket = TokenBucket(provider.rate, provider.burst)
+        self.slots = asyncio.Semaphore(concurrency)
+        self.locationSlots = asyncio.Semaphore(LOCATIONS_IN_FLIGHT)
+        self.retries = retries
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": USER_AGENT, "Referer": REFERER})
+        self.searches = {} # normalised query -> task, the same query is only sent once per run
+        self.stats = collections.Counter()
+
+    def backoff(self, attempt):
+        # Exponential backoff with full jitter, so retrying requests do not all come back at once
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE*2**attempt))
+
+    async def fetch(self, query, key):
+        # The cached answer, or one provider request with retries, returns what the provider parsed or None.
+        # Raises GeocodeError when the provider gave no answer
+        if self.cache is not None:
+            cached, result = self.cache.get(self.provider.name, key)
+            if cached:
+                self.stats["cached"] += 1
+                return result
+
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            async with self.slots:
+                self.stats["requests"] += 1
+                try:
+                    response = await asyncio.to_thread(self.provider.request, self.session, query)
+                except requests.RequestException as e:
+                    print(f"Request for {query} failed: {e}")
+                    response = None
+
+            if response is not None and response.status_code < 400:
+                try:
+                    result = self.provider.parse(response.json())
+                except (ValueError, LookupError, TypeError, AttributeError) as e:
+                    # Not JSON or not shaped like the provider's answers, such as a proxy or captive portal page.
+                    # Retried like a failed request and never cached
+                    print(f"Answer for {query} could not be read: {e!r}")
+                    self.stats["badAnswers"] += 1
+                    response = None
+                else:
+                    if self.cache is not None: # Not found is an answer too, failures are not
+                        self.cache.put(self.provider.name, key, result)
+                    return result
+            if response is not None and response.status_code < 500 and response.status_code != 429:
+                self.stats["failed"] += 1
+                raise GeocodeError(f"Request for {query} was refused with {response.status_code}")
+
+            delay = self.backoff(attempt)
+            if response is not None and response.status_code == 429:
+                self.stats["rateLimited"] += 1
+                retryAfter = response.headers.get("Retry-After", "")
+                delay = max(delay, float(retryAfter) if retryAfter.isdigit() else 0)
+                self.bucket.pause(delay) # Everyone slows down, not just this request
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+        self.stats["failed"] += 1
+        raise GeocodeError(f"Giving up on {query}")
+
+    def search(self, query):
+        key = normaliseQuery(query)
+        if key not in self.searches:
+            self.searches[key] = asyncio.ensure_future(self.fetch(query, key))
+            # Fallbacks nobody waits for any more can fail unseen
+            self.searches[key].add_done_callback(lambda task: task.cancelled() or task.exception())
+        else:
+            self.stats["shared"] += 1
+        return self.searches[key]
+
+    async def geocode(self, query):
+        # The place for a query, leaving out its first parts when it is not found, None when nothing matches
+        result = await self.search(query)
+        if result is not None:
+            return result
+
+        components = query.split(",")
+        fallbacks = [",".join(components[i:]) for i in range(1, min(FALLBACKS + 1, len(components)))]
+        # All fallbacks are asked for at once, the most specific one that is found wins
+        searches = [self.search(fallback) for fallback in fallbacks]
+        for fallback, search in zip(fallbacks, searches):
+            result = await search
+            if result is not None:
+                return result
+        return None
+
+    async def geocodeLocation(self, title, location, onResult=None):
+        # Status is found, notFound or failed when the provider gave no answer, which is worth trying again
+        try:
+            async with self.locationSlots:
+                result = await self.geocode(location[0])
+            status = "found" if result is not None else "notFound"
+        except GeocodeError as e:
+            print(e)
+            result, status = None, "failed"
+        if status == "found":
+            self.stats["found"] += 1
+        else:
+            print(f"could not find {location[0]}")
+        if onResult is not None:
+            onResult(title, location, result, status)
+        return result
+
+    async def geocodeLocations(self, locationSet, onResult=None):
+        # Adds the display name and [lat, lon] to every location of every title, leaving out places not found.
+        # onResult(title, location, result, status) is called as soon as a location is done
+        titles = 0
+
+        async def geocodeTitle(title, locations):
+            nonlocal titles
+            results = await asyncio.gather(*(self.geocodeLocation(title, location, onResult) for location in locations))
+            newLocations = [location + [result[0], result[1]]
+                            for location, result in zip(locations, results) if result is not None]
+            titles += 1
+            print(f"Done with {titles}/{len(locationSet)} titles")
+            return title, newLocations
+
+        try:
+            return dict(await asyncio.gather(*(geocodeTitle(title, locations) for title, locations in locationSet.items())))
+        finally:
+            self.session.close()
@@ -1,53 +1,5 @@
-import requests
-import sqlite3
-import time
-import pathlib
+from omdbEnricher import runEnrichment
 
-conn = sqlite3.connect('database.db')
-
-cur = conn.cursor()
-conn.execute("PRAGMA foreign_keys=ON")
-
-ids = conn.execute("SELECT id FROM movies")
-
-
-omdb_key = ''
-with open("omdb.txt", 'r') as f:
-    omdb_key = f.readline()
-iter = 0
-
-for id in ids:
-    id = id[0]
-
-    out = pathlib.Path("posters")
-    out.mkdir(parents=True, exist_ok=True)
-
-    path = out / f"{id}.jpg"
-    if path.exists():
-        continue
-    url = "http://img.omdbapi.com/"
-    params = {"apikey": omdb_key, "i": id} 
-    r = requests.get(url, params=params, timeout=15)
-    try:
-        r.raise_for_status()
-        
-    except Exception as e:
-        print(id)
-        print(e)
-
-    ctype = (r.headers.get("content-type") or "").lower()
-    if "png" in ctype:
-        ext = ".png"
-    elif "webp" in ctype:
-        ext = ".webp"
-    else:
-        ext = ".jpg"  # default
-
-    
-
-    
-    path.write_bytes(r.content)
-    iter += 1
-    print("Done with", iter)
-
-    time.sleep(3)
\ No newline at end of file
+# Posters only, omdbEnricher.py fetches plots and posters together from one request per title
+if __name__ == '__main__':
+    runEnrichment(plots=False)
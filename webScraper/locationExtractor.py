@@ -0,0 +1,191 @@
+import argparse
+import collections
+import concurrent.futures
+import json
+import pathlib
+import requests
+from bs4 import BeautifulSoup
+
+# Filming locations of a title without a browser when possible.
+# The locations page is fetched with plain requests and read from the page data Next.js embeds in it,
+# or from the server-rendered cards when there is none. Only when neither gives the full list does the
+# title go to the browser. The parsers take HTML strings, so saved pages can be checked offline.
+
+LOCATIONS_URL = "https://www.imdb.com/title/{}/locations"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Referer": "https://www.imdb.com/",
+}
+TIMEOUT = 15
+MIN_VOTES = 6 # Only take locations that have been voted on a lot, like the browser scraper
+FETCH_WORKERS = 4
+PATHS = ("json", "cards", "browser", "failed")
+
+
+def selectLocations(cards):
+    # cards are (location, scene, votes) in page order, the list stops at the first one with too few votes.
+    # Returns the [location, scene] kept and whether the list stopped before the end of the cards
+    locations = []
+    for location, scene, votes in cards:
+        if votes is None or votes < MIN_VOTES:
+            return locations, True
+        locations.append([location, scene])
+    return locations, False
+
+def findItemLists(node):
+    # Every list in the page data whose entries look like location cards, with the dict holding it
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if (isinstance(value, list) and value and isinstance(value[0], dict)
+                    and "cardText" in value[0] and "userVotingProps" in value[0]):
+                yield node, value
+            else:
+                yield from findItemLists(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from findItemLists(value)
+
+def parseNextData(html):
+    # Returns (locations, complete) from the embedded __NEXT_DATA__ JSON, None when the page has none
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, "html.parser")
+    script = soup.find("script", id="__NEXT_DATA__")
+    if script is None or not script.string:
+        return None
+    try:
+        data = json.loads(script.string)
+    except ValueError:
+        return None
+    found = next(findItemLists(data), None)
+    if found is None:
+        return None
+    section, items = found
+    cards = []
+    for item in items:
+        votes = (item.get("userVotingProps") or {}).get("upVotes")
+        scene = item.get("cardAttributes") or ""
+        if isinstance(scene, list):
+            scene = ", ".join(str(part) for part in scene)
+        cards.append((item["cardText"], scene, votes))
+    locations, stopped = selectLocations(cards)
+    # The page only holds the first items, the rest are loaded by the "more" button
+    total = section.get("total")
+    complete = stopped or total is None or total <= len(items)
+    return locations, complete
+
+def parseCards(html):
+    # Returns (locations, complete) from the server-rendered location cards, None when there are none
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, "html.parser")
+    cardElements = soup.select('div[data-testid="item-id"]')
+    if not cardElements:
+        return None
+    cards = []
+    for card in cardElements:
+        location = card.select_one('a[data-testid="item-text-with-link"]')
+        scene = card.select_one('p[data-testid="item-attributes"]')
+        votes = card.select_one("span.ipc-voting__label__count--up")
+        try:
+            votes = int(votes.get_text(strip=True)) if votes is not None else None
+        except ValueError:
+            votes = None
+        cards.append((location.get_text(strip=True) if location else "", scene.get_text(strip=True) if scene else "", votes))
+    locations, stopped = selectLocations(cards)
+    hasMore = soup.select_one("span.ipc-see-more__text") is not None
+    return locations, stopped or not hasMore
+
+def parseLocations(html):
+    # Returns (locations, path) with path json or cards, or (None, None) when the page did not give the full list
+    soup = BeautifulSoup(html, "html.parser")
+    for path, parser in (("json", parseNextData), ("cards", parseCards)):
+        parsed = parser(soup)
+        if parsed is not None and parsed[1]:
+            return parsed[0], path
+    return None, None
+
+
+class LocationExtractor:
+
+    def __init__(self, browserScrape=None, fetchWorkers=FETCH_WORKERS, saveDir=None):
+        # browserScrape(titles) yields (title, locations, error) for the titles plain HTTP could not do
+        self.browserScrape = browserScrape
+        self.fetchWorkers = fetchWorkers
+        self.saveDir = pathlib.Path(saveDir) if saveDir else None
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        self.paths = collections.Counter()
+
+    def fetch(self, title):
+        # The HTML of the locations page, None when it was not served (blocked, challenged or missing)
+        try:
+            response = self.session.get(LOCATIONS_URL.format(title), timeout=TIMEOUT)
+        except requests.RequestException as e:
+            print(f"Fetching {title} failed: {e}")
+            return None
+        if response.status_code != 200:
+            return None
+        if self.saveDir is not None: # Keep the page to check the parsers against offline
+            self.saveDir.mkdir(parents=True, exist_ok=True)
+            (self.saveDir / f"{title}.html").write_text(response.text, encoding="utf-8")
+        return response.text
+
+    def extractHttp(self, title):
+        html = self.fetch(title)
+        if html is None:
+            return None, None
+        return parseLocations(html)
+
+    def extract(self, titles, http=True):
+        # Yields (title, locations, path) for every title, first everything plain HTTP can do, then the browser
+        if not http:
+            leftOver = list(titles)
+        else:
+            leftOver = []
+            executor = concurrent.futures.ThreadPoolExecutor(self.fetchWorkers)
+            try:
+                futures = {executor.submit(self.extractHttp, title): title for title in titles}
+                for future in concurrent.futures.as_completed(futures):
+                    title = futures[future]
+                    locations, path = future.result()
+                    if path is None:
+                        leftOver.append(title)
+                        continue
+                    self.paths[path] += 1
+                    yield title, locations, path
+            finally: # Stopped early, pages not fetched yet are dropped
+                executor.shutdown(cancel_futures=True)
+
+        if leftOver and self.browserScrape is not None:
+            print(f"{len(leftOver)} titles need the browser")
+            for title, locations, error in self.browserScrape(leftOver):
+                path = "browser" if error is None else "failed"
+                if error is not None:
+                    print(f"Failed on {title}: {error}")
+                self.paths[path] += 1
+                yield title, locations or [], path
+        else:
+            for title in leftOver:
+                self.paths["failed"] += 1
+                yield title, [], "failed"
+
+    def summary(self):
+        total = max(sum(self.paths.values()), 1)
+        return ", ".join(f"{path} {self.paths[path]} ({self.paths[path]/total:.0%})" for path in PATHS)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Parse saved IMDb locations pages, or fetch titles without a browser")
+    parser.add_argument("sources", nargs="+", help="saved .html files or title ids like tt0120737")
+    parser.add_argument("--save", help="directory to keep fetched pages in")
+    args = parser.parse_args()
+
+    extractor = LocationExtractor(saveDir=args.save)
+    for source in args.sources:
+        if source.endswith(".html"):
+            locations, path = parseLocations(pathlib.Path(source).read_text(encoding="utf-8"))
+        else:
+            locations, path = extractor.extractHttp(source)
+        print(f"{source}: {path or 'needs the browser'}")
+        for location in locations or []:
+            print(f"    {location[0]} {location[1]}")
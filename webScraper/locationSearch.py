@@ -0,0 +1,179 @@
+import argparse
+import math
+import random
+import sqlite3
+import statistics
+import time
+
+# Nearest neighbour and radius lookups on the locations table.
+# An R*Tree virtual table holds every location as a point and is kept in sync with triggers. A lookup takes
+# the candidates in a latitude/longitude box around the point from the tree and refines them with the
+# haversine distance, so results are in real metres instead of degrees.
+
+EARTH_RADIUS = 6371008.8 # Mean radius in metres
+METRES_PER_DEGREE = math.pi*EARTH_RADIUS/180
+START_RADIUS = 1000 # Metres of the first box a nearest neighbour lookup tries, doubled until there are enough
+LOCATION_COLUMNS = "l.id, l.movie_id, l.lat, l.lon, l.place, l.info"
+SPATIAL_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS locations_rtree USING rtree(id, minLat, maxLat, minLon, maxLon)",
+    # Locations added before the tree existed, or while its triggers did not
+    "INSERT INTO locations_rtree SELECT id, lat, lat, lon, lon FROM locations l "
+    "WHERE lat IS NOT NULL AND lon IS NOT NULL AND NOT EXISTS (SELECT 1 FROM locations_rtree r WHERE r.id = l.id)",
+    "CREATE TRIGGER IF NOT EXISTS locations_rtree_insert AFTER INSERT ON locations "
+    "WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN "
+    "INSERT OR REPLACE INTO locations_rtree VALUES (new.id, new.lat, new.lat, new.lon, new.lon); END",
+    "CREATE TRIGGER IF NOT EXISTS locations_rtree_update AFTER UPDATE OF id, lat, lon ON locations BEGIN "
+    "DELETE FROM locations_rtree WHERE id = old.id; "
+    "INSERT INTO locations_rtree SELECT new.id, new.lat, new.lat, new.lon, new.lon "
+    "WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL; END",
+    "CREATE TRIGGER IF NOT EXISTS locations_rtree_delete AFTER DELETE ON locations BEGIN "
+    "DELETE FROM locations_rtree WHERE id = old.id; END",
+)
+
+
+def createSpatialIndex(conn):
+    with conn:
+        for statement in SPATIAL_INDEX:
+            conn.execute(statement)
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Great circle distance in metres
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1)/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin((lon2 - lon1)/2)**2
+    return 2*EARTH_RADIUS*math.asin(min(1.0, math.sqrt(a)))
+
+def boundingBoxes(lat, lon, radius):
+    # (minLat, maxLat, minLon, maxLon) boxes that hold every point within radius metres,
+    # two of them when the circle crosses the antimeridian
+    dLat = radius/METRES_PER_DEGREE
+    minLat, maxLat = max(lat - dLat, -90.0), min(lat + dLat, 90.0)
+    cosLat = math.cos(math.radians(max(abs(minLat), abs(maxLat))))
+    if maxLat >= 90 or minLat <= -90 or cosLat <= 0 or radius/(METRES_PER_DEGREE*cosLat) >= 180:
+        return [(minLat, maxLat, -180.0, 180.0)] # Over a pole every longitude is close
+    dLon = radius/(METRES_PER_DEGREE*cosLat)
+    minLon, maxLon = lon - dLon, lon + dLon
+    if minLon < -180:
+        return [(minLat, maxLat, minLon + 360, 180.0), (minLat, maxLat, -180.0, maxLon)]
+    if maxLon > 180:
+        return [(minLat, maxLat, minLon, 180.0), (minLat, maxLat, -180.0, maxLon - 360)]
+    return [(minLat, maxLat, minLon, maxLon)]
+
+
+class LocationSearch:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.spatial = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'locations_rtree'"
+        ).fetchone() is not None # Without it (a database built before the index) every lookup scans the table
+
+    def candidates(self, box):
+        minLat, maxLat, minLon, maxLon = box
+        if self.spatial:
+            query = (f"SELECT {LOCATION_COLUMNS} FROM locations_rtree r JOIN locations l ON l.id = r.id "
+                     "WHERE r.maxLat >= ? AND r.minLat <= ? AND r.maxLon >= ? AND r.minLon <= ?")
+        else:
+            query = (f"SELECT {LOCATION_COLUMNS} FROM locations l "
+                     "WHERE l.lat >= ? AND l.lat <= ? AND l.lon >= ? AND l.lon <= ?")
+        return self.conn.execute(query, (minLat, maxLat, minLon, maxLon)).fetchall()
+
+    def withDistances(self, lat, lon, radius):
+        # (distance, row) of every location within radius metres, closest first
+        found = []
+        for box in boundingBoxes(lat, lon, radius):
+            for row in self.candidates(box):
+                distance = haversine(lat, lon, row[2], row[3])
+                if distance <= radius:
+                    found.append((distance, row))
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def withinRadius(self, lat, lon, radius):
+        # Locations within radius metres as dicts with their distance, closest first
+        return [self.toDict(row, distance) for distance, row in self.withDistances(lat, lon, radius)]
+
+    def nearest(self, lat, lon, k):
+        # The k closest locations, growing the search radius until it holds k of them
+        radius = START_RADIUS
+        while True:
+            found = self.withDistances(lat, lon, radius)
+            if len(found) >= k or radius >= math.pi*EARTH_RADIUS:
+                return [self.toDict(row, distance) for distance, row in found[:k]]
+            radius *= 2 if found else 4
+
+    @staticmethod
+    def toDict(row, distance):
+        id, movieId, lat, lon, place, info = row
+        return {"id": id, "movie_id": movieId, "lat": lat, "lon": lon, "place": place, "info": info, "distance": distance}
+
+
+def benchmarkDatabase(rows, seed=0):
+    # In-memory locations table with rows points clustered around cities, like filming locations are
+    rng = random.Random(seed)
+    cities = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(200)]
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE locations(id INTEGER PRIMARY KEY, movie_id TEXT NOT NULL, lat REAL, lon REAL, place TEXT, info TEXT)")
+    points = []
+    for i in range(rows):
+        cityLat, cityLon = rng.choice(cities)
+        points.append((f"tt{i % 10000:07d}", cityLat + rng.gauss(0, 0.5), ((cityLon + rng.gauss(0, 0.5) + 180) % 360) - 180, "", ""))
+    with conn:
+        conn.executemany("INSERT INTO locations (movie_id, lat, lon, place, info) VALUES (?, ?, ?, ?, ?)", points)
+    return conn, cities
+
+def runBenchmark(rowCounts, queries=200, k=10, radius=5000):
+    # Median milliseconds per lookup with and without the spatial index for every table size
+    print(f"{'rows':>10} {'knn rtree':>10} {'knn scan':>10} {'radius rtree':>13} {'radius scan':>12}")
+    for rows in rowCounts:
+        conn, cities = benchmarkDatabase(rows)
+        rng = random.Random(1)
+        points = [(lat + rng.gauss(0, 0.5), lon + rng.gauss(0, 0.5)) for lat, lon in rng.choices(cities, k=queries)]
+        timings = {}
+        scanSearch = LocationSearch(conn)
+        createSpatialIndex(conn)
+        for name, search in (("rtree", LocationSearch(conn)), ("scan", scanSearch)):
+            for lookup, run in (("knn", lambda p: search.nearest(p[0], p[1], k)),
+                                ("radius", lambda p: search.withinRadius(p[0], p[1], radius))):
+                samples = []
+                for point in points:
+                    start = time.perf_counter()
+                    run(point)
+                    samples.append((time.perf_counter() - start)*1000)
+                timings[lookup, name] = statistics.median(samples)
+        print(f"{rows:>10} {timings['knn', 'rtree']:>10.3f} {timings['knn', 'scan']:>10.3f} "
+              f"{timings['radius', 'rtree']:>13.3f} {timings['radius', 'scan']:>12.3f}")
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Find filming locations near a point")
+    commands = parser.add_subparsers(dest="command", required=True)
+    near = commands.add_parser("near", help="the k closest locations")
+    near.add_argument("lat", type=float)
+    near.add_argument("lon", type=float)
+    near.add_argument("--k", type=int, default=10)
+    within = commands.add_parser("radius", help="all locations within a radius")
+    within.add_argument("lat", type=float)
+    within.add_argument("lon", type=float)
+    within.add_argument("metres", type=float)
+    for command in (near, within):
+        command.add_argument("--database", default="database.db")
+    bench = commands.add_parser("bench", help="lookup latency against table size on synthetic locations")
+    bench.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    bench.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        runBenchmark(args.rows, args.queries)
+    else:
+        conn = sqlite3.connect(args.database)
+        search = LocationSearch(conn)
+        if not search.spatial:
+            print("No spatial index on the locations, run convertToDatabase.py to build it")
+        if args.command == "near":
+            results = search.nearest(args.lat, args.lon, args.k)
+        else:
+            results = search.withinRadius(args.lat, args.lon, args.metres)
+        for location in results:
+            print(f"{location['distance']:>10.0f} m  {location['movie_id']}  {location['place']} {location['info']}")
+        conn.close()
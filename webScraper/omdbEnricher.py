@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import collections
+import os
+import pathlib
+import random
+import sqlite3
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from demoData import SYNTHETIC
+from posterAssets import processPosters
+from tokenBucket import TokenBucket
+
+# Plots and posters for every movie in the database from one OMDb request per title.
+# The metadata answer holds both the plot and the poster's URL, so a title costs one request of the daily
+# budget instead of one per script. Requests share a pooled session, a bounded number are in flight and a
+# token bucket keeps them within the requests per second OMDb allows. Plots are written in batches and
+# titles that already have a plot and a poster are not asked for again. Neither are, for a while, titles OMDb
+# did not know or had no poster for, so they do not use up the daily budget on every run. Synthetic movies
+# from seedDatabase.py are left out. New posters go through posterAssets.py.
+
+OMDB_URL = "http://www.omdbapi.com/"
+LOCAL_URL = "http://localhost:8992/" # omdbStandIn.py
+KEY_PATH = "omdb.txt"
+DATABASE_PATH = "database.db"
+POSTER_DIR = "posters"
+RATE = 5.0 # OMDb requests per second
+BURST = 5
+WORKERS = 8 # Titles in flight at once
+TIMEOUT = 15
+RETRIES = 3
+BACKOFF_BASE = 1.0 # Seconds before the first retry, doubled every attempt
+BACKOFF_CAP = 30.0
+UPDATES_PER_COMMIT = 50
+RETRY_AFTER_DAYS = 30 # Titles with no answer worth having are asked for again after this long
+NOT_FOUND_ERRORS = ("Incorrect IMDb ID.", "Movie not found!") # Other errors, like the request limit, are not about the title
+ATTEMPTS_TABLE = "CREATE TABLE IF NOT EXISTS omdb_attempts(movie_id TEXT PRIMARY KEY, status TEXT NOT NULL, attempted REAL NOT NULL)"
+
+
+class OmdbError(Exception):
+    # A request that got no usable answer
+    pass
+
+
+class Enricher:
+
+    def __init__(self, conn, apiKey, url=OMDB_URL, rate=RATE, workers=WORKERS, posterDir=POSTER_DIR,
+                 plots=True, posters=True, retryMissing=False):
+        self.conn = conn
+        self.apiKey = apiKey
+        self.url = url
+        self.workers = workers
+        self.posterDir = pathlib.Path(posterDir)
+        self.plots = plots
+        self.posters = posters
+        self.retryMissing = retryMissing
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=workers) # One keep-alive connection per worker
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.bucket = None
+        self.rate = rate
+        self.updates = []
+        self.attempts = []
+        self.stats = collections.Counter()
+
+    def pending(self):
+        # (id, needs plot, needs poster) of every title that is missing something
+        if self.plots:
+            try:
+                self.conn.execute("ALTER TABLE movies ADD COLUMN plot TEXT")
+            except sqlite3.OperationalError:
+                pass
+        with self.conn:
+            self.conn.execute(ATTEMPTS_TABLE)
+        rows = self.conn.execute(
+            f"SELECT id, {'plot IS NULL' if self.plots else '0'} FROM movies WHERE id NOT LIKE '%' || ? || '%'", (SYNTHETIC,)
+        ).fetchall()
+        havePosters = {path.stem for path in self.posterDir.glob("*.jpg")} if self.posters else set()
+        attempts = {} if self.retryMissing else dict(self.conn.execute(
+            "SELECT movie_id, status FROM omdb_attempts WHERE attempted > ?", (time.time() - RETRY_AFTER_DAYS*86400,)
+        ))
+        titles = []
+        for id, noPlot in rows:
+            status = attempts.get(id)
+            if status == "notFound":
+                self.stats["knownMissing"] += 1
+                continue
+            needsPlot = self.plots and bool(noPlot)
+            needsPoster = self.posters and id not in havePosters and status != "noPoster"
+            if needsPlot or needsPoster:
+                titles.append((id, needsPlot, needsPoster))
+        self.stats["skipped"] = len(rows) - len(titles)
+        return titles
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE*2**attempt))
+
+    async def get(self, url, params=None, limited=True):
+        # One GET with retries, limited ones take a token first. Raises OmdbError when it does not work out
+        for attempt in range(RETRIES + 1):
+            if limited:
+                await self.bucket.acquire()
+            self.stats["requests" if limited else "downloads"] += 1
+            try:
+                response = await asyncio.to_thread(self.session.get, url, params=params, timeout=TIMEOUT)
+            except requests.RequestException as e:
+                print(f"Request to {url} failed: {e}")
+                response = None
+            if response is not None and response.status_code < 400:
+                return response
+            if response is not None and response.status_code < 500 and response.status_code != 429:
+                raise OmdbError(f"{url} refused with {response.status_code}: {response.text[:100]}")
+            delay = self.backoff(attempt)
+            if response is not None and response.status_code == 429:
+                self.stats["rateLimited"] += 1
+                retryAfter = response.headers.get("Retry-After", "")
+                delay = max(delay, float(retryAfter) if retryAfter.isdigit() else 0)
+                if limited:
+                    self.bucket.pause(delay)
+            await asyncio.sleep(delay)
+        raise OmdbError(f"Giving up on {url}")
+
+    async def fetchPoster(self, id, posterUrl):
+        if not posterUrl or posterUrl == "N/A":
+            self.stats["noPoster"] += 1
+            self.queueAttempt(id, "noPoster")
+            return
+        # The poster URL points at the image host, not the API, so it does not count against the budget
+        response = await self.get(posterUrl, limited=False)
+        if not (response.headers.get("content-type") or "").lower().startswith("image/"):
+            raise OmdbError(f"Poster of {id} is not an image")
+        self.posterDir.mkdir(parents=True, exist_ok=True)
+        path = self.posterDir / f"{id}.jpg"
+        partial = path.with_suffix(".part") # Never leave half a poster behind that looks done
+        partial.write_bytes(response.content)
+        os.replace(partial, path)
+        self.stats["posters"] += 1
+
+    async def enrichTitle(self, id, needsPlot, needsPoster, slots):
+        async with slots:
+            try:
+                response = await self.get(self.url, {"apikey": self.apiKey, "i": id, "r": "json", "plot": "short"})
+                data = response.json()
+                if data.get("Response") != "True":
+                    print(f"No data for {id}: {data.get('Error')}")
+                    if data.get("Error") in NOT_FOUND_ERRORS:
+                        self.stats["notFound"] += 1
+                        self.queueAttempt(id, "notFound")
+                    else:
+                        self.stats["failed"] += 1
+                    return
+                if needsPlot:
+                    self.queueUpdate(data.get("Plot", ""), id)
+                if needsPoster:
+                    await self.fetchPoster(id, data.get("Poster"))
+            except (OmdbError, ValueError) as e:
+                print(f"Failed on {id}: {e}")
+                self.stats["failed"] += 1
+
+    def queueUpdate(self, plot, id):
+        self.updates.append((plot, id))
+        if len(self.updates) + len(self.attempts) >= UPDATES_PER_COMMIT:
+            self.flush()
+
+    def queueAttempt(self, id, status):
+        # Remembers that asking again soon will not help
+        self.attempts.append((id, status, time.time()))
+        if len(self.updates) + len(self.attempts) >= UPDATES_PER_COMMIT:
+            self.flush()
+
+    def flush(self):
+        if self.updates or self.attempts:
+            with self.conn:
+                self.conn.executemany("UPDATE movies SET plot = ? WHERE id = ?", self.updates)
+                self.conn.executemany(
+                    "INSERT INTO omdb_attempts (movie_id, status, attempted) VALUES (?, ?, ?) "
+                    "ON CONFLICT(movie_id) DO UPDATE SET status = excluded.status, attempted = excluded.attempted",
+                    self.attempts
+                )
+            self.stats["plots"] += len(self.updates)
+            self.updates = []
+            self.attempts = []
+
+    async def run(self):
+        titles = self.pending()
+        print(f"{len(titles)} titles to enrich, {self.stats['skipped']} already done or known to be missing")
+        self.bucket = TokenBucket(self.rate, BURST) # Made in the running event loop
+        slots = asyncio.Semaphore(self.workers)
+        done = 0
+
+        async def enrich(title):
+            nonlocal done
+            await self.enrichTitle(*title, slots)
+            done += 1
+            if done % 50 == 0:
+                print(f"Done with {done}/{len(titles)}")
+
+        try:
+            await asyncio.gather(*(enrich(title) for title in titles))
+        finally:
+            self.flush()
+            self.session.close()
+        return self.stats
+
+
+def readKey(path=KEY_PATH):
+    if os.environ.get("OMDB_KEY"):
+        return os.environ["OMDB_KEY"]
+    with open(path, "r") as f:
+        return f.readline().strip()
+
+def runEnrichment(plots=True, posters=True):
+    parser = argparse.ArgumentParser(description="Fetch plots and posters of the movies in the database from OMDb")
+    parser.add_argument("--database", default=DATABASE_PATH)
+    parser.add_argument("--posters", default=POSTER_DIR, help="directory the posters are saved in")
+    parser.add_argument("--rate", type=float, default=RATE, help="OMDb requests per second")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="titles in flight at once")
+    parser.add_argument("--url", default=OMDB_URL)
+    parser.add_argument("--local", action="store_true", help="use omdbStandIn.py instead of OMDb")
+    parser.add_argument("--key-file", default=KEY_PATH, help="file with the API key, OMDB_KEY is used when set")
+    parser.add_argument("--retry-missing", action="store_true",
+                        help=f"also ask for titles OMDb did not know or had no poster for in the last {RETRY_AFTER_DAYS} days")
+    args = parser.parse_args()
+
+    url = LOCAL_URL if args.local else args.url
+    apiKey = "local" if args.local else readKey(args.key_file)
+    conn = sqlite3.connect(args.database)
+    enricher = Enricher(conn, apiKey, url, args.rate, args.workers, args.posters, plots, posters, args.retry_missing)
+    try:
+        stats = asyncio.run(enricher.run())
+    except KeyboardInterrupt:
+        stats = enricher.stats
+        print("Stopped, plots fetched so far are saved")
+    conn.close()
+    print(f"Done! {dict(stats)}")
+    if stats["posters"]: # Check the new downloads and make their smaller versions
+        processPosters(args.posters)
+
+
+if __name__ == '__main__':
+    runEnrichment()
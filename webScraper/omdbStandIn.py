@@ -0,0 +1,113 @@
+import argparse
+import collections
+import cv2
+import hashlib
+import json
+import numpy as np
+import pathlib
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OMDb API, to run the enrichment against without spending the daily request budget.
+# Every id gets a made-up title and plot, some are unknown or have no poster like on the real service,
+# posters are made up and served by the stand-in itself and requests above the rate limit get a 429.
+
+PORT = 8992
+RATE = 20 # Metadata requests per second before answering 429
+POSTER_SIZE = (300, 450) # Width and height of the made-up posters
+
+
+def posterJpeg(id):
+    # A poster in a colour of its own with the id written on it
+    digest = hashlib.sha1(id.encode()).digest()
+    width, height = POSTER_SIZE
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = list(digest[:3])
+    cv2.putText(image, id, (20, height//2), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def send(self, status, data, contentType, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def sendJson(self, status, body, headers=()):
+        self.send(status, json.dumps(body).encode(), "application/json; charset=utf-8", headers)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.startswith("/posters/"):
+            return self.send(200, posterJpeg(pathlib.PurePosixPath(url.path).stem), "image/jpeg")
+        if url.path != "/":
+            return self.sendJson(404, {"Response": "False", "Error": "Not found"})
+        params = urllib.parse.parse_qs(url.query)
+        if not params.get("apikey"):
+            return self.sendJson(401, {"Response": "False", "Error": "No API key provided."})
+        if not self.server.allow():
+            return self.sendJson(429, {"Response": "False", "Error": "Too many requests"}, [("Retry-After", "1")])
+        time.sleep(self.server.latency)
+        id = params.get("i", [""])[0]
+        self.server.count(id)
+        kind = hashlib.sha1(id.encode()).digest()[0] % 10
+        if kind == 0:
+            return self.sendJson(200, {"Response": "False", "Error": "Incorrect IMDb ID."})
+        host, port = self.server.server_address[:2]
+        poster = "N/A" if kind == 1 else f"http://{host}:{port}/posters/{id}.jpg"
+        self.sendJson(200, {"Title": f"Title {id}", "Plot": f"The made-up plot of {id}.", "Poster": poster, "Response": "True"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, rate=RATE, latency=0.0):
+        super().__init__(address, StandInHandler)
+        self.rate = rate
+        self.latency = latency
+        self.requests = []
+        self.limited = 0
+        self.perId = collections.Counter()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        # Sliding one second window, like a provider counting requests per key
+        with self.lock:
+            now = time.monotonic()
+            self.requests = [t for t in self.requests if now - t < 1]
+            if len(self.requests) >= self.rate:
+                self.limited += 1
+                return False
+            self.requests.append(now)
+            return True
+
+    def count(self, id):
+        with self.lock:
+            self.perId[id] += 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stand-in OMDb server for testing the enrichment")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--rate", type=float, default=RATE, help="requests per second before answering 429")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every answer takes")
+    args = parser.parse_args()
+
+    server = StandInServer(("localhost", args.port), args.rate, args.latency)
+    print(f"Stand-in OMDb on http://localhost:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        repeated = sum(1 for count in server.perId.values() if count > 1)
+        print(f"Answered {sum(server.perId.values())} metadata requests for {len(server.perId)} ids "
+              f"({repeated} asked more than once), 429 to {server.limited}")
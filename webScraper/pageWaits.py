@@ -0,0 +1,110 @@
+import collections
+import contextlib
+import threading
+import time
+from selenium.common.exceptions import ElementClickInterceptedException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Page interaction on explicit waits: every step returns as soon as its condition holds instead of
+# sleeping for the worst case, and the time of every step is collected per step name.
+
+TIMEOUT = 10 # Seconds a step waits at most for its condition
+POLL = 0.1
+SCROLL_ROUNDS = 5 # Times the page is scrolled to the bottom to make lazily rendered content appear
+
+
+class StepStats:
+    # Count, total and worst time and timeouts of every step, shared by all browsers of a pool
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.steps = collections.defaultdict(lambda: {"count": 0, "seconds": 0.0, "max": 0.0, "timeouts": 0})
+
+    @contextlib.contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        timedOut = False
+        try:
+            yield
+        except TimeoutException:
+            timedOut = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                stats = self.steps[name]
+                stats["count"] += 1
+                stats["seconds"] += elapsed
+                stats["max"] = max(stats["max"], elapsed)
+                stats["timeouts"] += timedOut
+
+    def summary(self):
+        with self.lock:
+            return [
+                f"{name}: {stats['count']} times, mean {stats['seconds']/stats['count']:.2f} s, "
+                f"max {stats['max']:.2f} s, {stats['timeouts']} timeouts"
+                for name, stats in self.steps.items()
+            ]
+
+
+stepStats = StepStats()
+
+
+def wait(driver, timeout=TIMEOUT):
+    return WebDriverWait(driver, timeout, poll_frequency=POLL)
+
+def load(driver, url, timeout=TIMEOUT):
+    # Opens a page and waits until its document has finished loading
+    with stepStats.step("load"):
+        driver.get(url)
+        wait(driver, timeout).until(lambda d: d.execute_script("return document.readyState") == "complete")
+
+def click(driver, element):
+    try:
+        element.click()
+    except ElementClickInterceptedException: # Covered by a sticky header or a banner
+        driver.execute_script("arguments[0].click();", element)
+
+def clickWhenClickable(driver, xpath, timeout=TIMEOUT):
+    # Clicks the element as soon as it can be clicked and waits for the page to react by dropping it.
+    # Raises TimeoutException when it never shows up
+    element = wait(driver, timeout).until(EC.element_to_be_clickable((By.XPATH, xpath)))
+    click(driver, element)
+    try:
+        wait(driver, timeout).until(EC.invisibility_of_element(element))
+    except TimeoutException: # Some buttons stay, the click is done anyway
+        pass
+
+def revealElement(driver, xpath, timeout=TIMEOUT):
+    # Returns the element, scrolling to the bottom when it is rendered lazily, or None when it never appears
+    roundTimeout = timeout/SCROLL_ROUNDS
+    for _ in range(SCROLL_ROUNDS):
+        try:
+            element = wait(driver, roundTimeout).until(EC.presence_of_element_located((By.XPATH, xpath)))
+        except TimeoutException:
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            continue
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
+        return element
+    return None
+
+def countOf(driver, xpath):
+    return len(driver.find_elements(By.XPATH, xpath))
+
+def waitForMore(driver, xpath, before, timeout=TIMEOUT):
+    # Waits until more than before elements match, returns if they did
+    try:
+        wait(driver, timeout).until(lambda d: countOf(d, xpath) > before)
+        return True
+    except TimeoutException:
+        return False
+
+def waitForAny(driver, xpath, timeout=TIMEOUT):
+    # Waits until at least one element matches, returns if one did
+    try:
+        wait(driver, timeout).until(EC.presence_of_element_located((By.XPATH, xpath)))
+        return True
+    except TimeoutException:
+        return False
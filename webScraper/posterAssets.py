@@ -0,0 +1,194 @@
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import time
+import cv2
+import numpy as np
+
+# Checks the downloaded posters and makes the smaller versions the apps load instead of the full image.
+# Every download is decoded (error pages and truncated files are moved to rejected/ so they are fetched
+# again), {id}.jpg is made a real JPEG since the server sends it as one, and next to it go
+#   thumb/{id}.jpg  a small version for the map
+#   gray/{id}.png   a grayscale version at the height the AR matcher extracts features at
+#   web/{id}.webp   a WebP for the web pages
+# Files are hashed so identical posters are only decoded once, and the rest run over a pool of processes.
+# manifest.json remembers the hash of every processed poster, so later runs only do new downloads.
+
+POSTER_DIR = "posters"
+MANIFEST = "manifest.json"
+REJECTED = "rejected"
+THUMB_HEIGHT = 160
+GRAY_HEIGHT = 480 # POSTER_HEIGHT of Webcam/posterIndex.py
+WEB_HEIGHT = 720
+JPEG_QUALITY = 90
+THUMB_QUALITY = 80
+WEBP_QUALITY = 80
+MIN_SIDE = 32 # Smaller images are placeholders, not posters
+DERIVATIVES = {"thumb": ".jpg", "gray": ".png", "web": ".webp"}
+MAGIC = ((b"\xff\xd8\xff", "jpeg"), (b"\x89PNG\r\n\x1a\n", "png"), (b"GIF87a", "gif"), (b"GIF89a", "gif"))
+
+
+def sniffFormat(data):
+    # The image format from the first bytes of the file, whatever its name or content type said
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    for magic, format in MAGIC:
+        if data.startswith(magic):
+            return format
+    return None
+
+def resizeToHeight(image, height):
+    # Never enlarges, a small poster stays small
+    if image.shape[0] <= height:
+        return image
+    width = max(1, round(image.shape[1]*height/image.shape[0]))
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+def writeImage(path, image, params=()):
+    ok, encoded = cv2.imencode(path.suffix, image, list(params))
+    if not ok:
+        raise ValueError(f"Could not encode {path}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".part")
+    partial.write_bytes(encoded.tobytes())
+    os.replace(partial, path)
+
+def derivativePath(posterDir, kind, id):
+    return pathlib.Path(posterDir) / kind / f"{id}{DERIVATIVES[kind]}"
+
+def processPoster(posterDir, id):
+    # Runs in a worker process. Returns (sha256 of {id}.jpg afterwards, info), raises ValueError for a bad download
+    source = pathlib.Path(posterDir) / f"{id}.jpg"
+    data = source.read_bytes()
+    format = sniffFormat(data)
+    if format is None:
+        raise ValueError("not an image")
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"{format} that does not decode")
+    height, width = image.shape[:2]
+    if min(height, width) < MIN_SIDE:
+        raise ValueError(f"only {width}x{height}")
+
+    if format != "jpeg":
+        writeImage(source, image, (cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY))
+        data = source.read_bytes()
+    writeImage(derivativePath(posterDir, "thumb", id), resizeToHeight(image, THUMB_HEIGHT),
+               (cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 1))
+    writeImage(derivativePath(posterDir, "gray", id),
+               cv2.cvtColor(resizeToHeight(image, GRAY_HEIGHT), cv2.COLOR_BGR2GRAY))
+    writeImage(derivativePath(posterDir, "web", id), resizeToHeight(image, WEB_HEIGHT),
+               (cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY))
+    return hashlib.sha256(data).hexdigest(), {"format": format, "width": width, "height": height}
+
+def linkOrCopy(source, target):
+    # Duplicates share the file on disk when the file system allows it
+    if source == target:
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial = target.with_name(target.name + ".part")
+    if partial.exists():
+        partial.unlink()
+    try:
+        os.link(source, partial)
+    except OSError:
+        shutil.copyfile(source, partial)
+    os.replace(partial, target)
+
+def sha256File(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class PosterAssets:
+
+    def __init__(self, posterDir=POSTER_DIR, workers=None):
+        self.posterDir = pathlib.Path(posterDir)
+        self.workers = workers or os.cpu_count()
+        self.manifestPath = self.posterDir / MANIFEST
+        self.manifest = {}
+        if self.manifestPath.exists():
+            with open(self.manifestPath, "r") as f:
+                self.manifest = json.load(f)
+        self.stats = collections.Counter()
+
+    def done(self, id, sha256):
+        # Processed before and unchanged since, with all its versions still there
+        entry = self.manifest.get(id)
+        return (entry is not None and entry["sha256"] == sha256
+                and all(derivativePath(self.posterDir, kind, id).exists() for kind in DERIVATIVES))
+
+    def reject(self, id, reason):
+        print(f"Rejected poster of {id}: {reason}")
+        rejected = self.posterDir / REJECTED
+        rejected.mkdir(parents=True, exist_ok=True)
+        os.replace(self.posterDir / f"{id}.jpg", rejected / f"{id}.bin")
+        self.manifest.pop(id, None)
+        self.stats["rejected"] += 1
+
+    def copyFrom(self, sourceId, id):
+        # id has the same poster as sourceId, which is already processed
+        linkOrCopy(self.posterDir / f"{sourceId}.jpg", self.posterDir / f"{id}.jpg")
+        for kind in DERIVATIVES:
+            linkOrCopy(derivativePath(self.posterDir, kind, sourceId), derivativePath(self.posterDir, kind, id))
+        self.manifest[id] = dict(self.manifest[sourceId])
+        self.stats["duplicates"] += 1
+
+    def run(self):
+        # Groups the posters by content, decodes one of every group in the pool and links the rest to it
+        start = time.perf_counter()
+        groups = collections.defaultdict(list)
+        processedBy = {entry["sha256"]: id for id, entry in self.manifest.items()}
+        for path in sorted(self.posterDir.glob("*.jpg")):
+            sha256 = sha256File(path)
+            if self.done(path.stem, sha256):
+                self.stats["unchanged"] += 1
+                continue
+            groups[sha256].append(path.stem)
+
+        toProcess = {}
+        for sha256, ids in groups.items():
+            sourceId = processedBy.get(sha256)
+            if sourceId is not None and self.done(sourceId, sha256):
+                for id in ids:
+                    self.copyFrom(sourceId, id)
+            else:
+                toProcess[ids[0]] = ids[1:]
+
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as executor:
+            futures = {executor.submit(processPoster, str(self.posterDir), id): id for id in toProcess}
+            for future in concurrent.futures.as_completed(futures):
+                id = futures[future]
+                try:
+                    sha256, info = future.result()
+                except ValueError as e:
+                    for rejectedId in [id] + toProcess[id]:
+                        self.reject(rejectedId, e)
+                    continue
+                self.manifest[id] = {"sha256": sha256, **info}
+                self.stats["processed"] += 1
+                for duplicate in toProcess[id]:
+                    self.copyFrom(id, duplicate)
+
+        partial = self.manifestPath.with_name(MANIFEST + ".part")
+        with open(partial, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(partial, self.manifestPath)
+        print(f"Posters done in {time.perf_counter() - start:.1f} s: {dict(self.stats)}")
+        return self.stats
+
+
+def processPosters(posterDir=POSTER_DIR, workers=None):
+    return PosterAssets(posterDir, workers).run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check downloaded posters and make their thumbnail, grayscale and WebP versions")
+    parser.add_argument("posterDir", nargs="?", default=POSTER_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="processes, one per core by default")
+    args = parser.parse_args()
+    processPosters(args.posterDir, args.workers)
@@ -3,8 +3,13 @@ from selenium.webdriver.common.by import By
 from webdriver_manager.microsoft import EdgeChromiumDriverManager
 from selenium.webdriver.edge.service import Service as EdgeService
 from selenium.webdriver.edge.options import Options as EdgeOptions
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+from driverPool import DriverPool
+from locationExtractor import LocationExtractor
+from pageWaits import TIMEOUT, click, clickWhenClickable, countOf, load, revealElement, stepStats, wait, waitForAny, waitForMore
+from titleIndex import TitleIndex
+import argparse
 import pickle as pk
 import polars as pl
 import time
@@ -23,69 +28,74 @@ edge_options.add_argument(
 )
 service = EdgeService(executable_path=r"../msedgedriver.exe")
 
-def clickConsent(driver):
-    time.sleep(1)
-    driver.find_element(
-                By.XPATH, "//*[self::button or @role='button'][contains(.,'Accept') or contains(.,'Agree') or contains(.,'Godkänn')]"
-            ).click()
-    time.sleep(1)
-    
-def clickMore(driver, scroll =  100):
-    # scroll until found
-    success = False 
-    iter = 0
-    while not success:
-        try:
-            btn = driver.find_element(
-                By.XPATH, "//button[.//span[contains(@class,'ipc-see-more__text') and contains(., 'more')]]"
-            )
-            btn.click()
-            success = True
-        except:
-            pass
-        driver.execute_script(f"window.scrollBy(0, {scroll});")
-        time.sleep(0.3)
-        iter += 1
-        if iter > 25:
-            print("Failed to find more button")
-            break
+WORKERS = 4 # Browsers scraping at the same time
+SAVE_EVERY = 20 # Titles scraped between saves of the dataset
+MORE_TIMEOUT = 3 # Seconds to look for the "more" button once the content is there, not every page has one
+CONSENT_XPATH = "//*[self::button or @role='button'][contains(.,'Accept') or contains(.,'Agree') or contains(.,'Godkänn')]"
+MORE_XPATH = "//button[.//span[contains(@class,'ipc-see-more__text') and contains(., 'more')]]"
+CARD_XPATH = '//div[@data-testid="item-id"]'
+RESULT_XPATH = "//li[@class='ipc-metadata-list-summary-item']"
 
-def scrapeLocations(currentMovie):
-    driver = webdriver.Edge(
+def newDriver():
+    return webdriver.Edge(
         service=service,
         options=edge_options
     )
+
+def clickConsent(driver, timeout = TIMEOUT):
+    # Clicks the consent dialog as soon as it shows up and waits for it to close
+    with stepStats.step("consent"):
+        clickWhenClickable(driver, CONSENT_XPATH, timeout)
+
+def acceptConsent(driver, timeout=None):
+    # Returns if the consent dialog was found and clicked
+    try:
+        clickConsent(driver, timeout or TIMEOUT)
+        return True
+    except TimeoutException:
+        return False
     
+def clickMore(driver, itemXpath = None, timeout = TIMEOUT):
+    # Clicks the "more" button, scrolling down if it is not rendered yet, and waits until more items
+    # matching itemXpath have loaded. Returns if the button was clicked
+    with stepStats.step("more"):
+        button = revealElement(driver, MORE_XPATH, timeout)
+        if button is None:
+            print("Failed to find more button")
+            return False
+        before = countOf(driver, itemXpath) if itemXpath else 0
+        click(driver, wait(driver, timeout).until(EC.element_to_be_clickable(button)))
+        if itemXpath:
+            waitForMore(driver, itemXpath, before, timeout)
+        return True
+
+def scrapeLocations(currentMovie, driver=None):
+    # Uses the given browser from the driver pool, which already accepted consent, or starts its own
+    ownDriver = driver is None
+    if ownDriver:
+        driver = newDriver()
 
     # Load the URL
     url = f"https://imdb.com/title/{currentMovie}/locations"
     print("Scraping: ", url)
-    driver.get(url)
+    load(driver, url)
 
     # Click consent
-    clicked = False
-    iter = 0
-    while not clicked and iter < 10:
-        try: 
-            clickConsent(driver)
-            clicked = True
-        except:
-            iter += 1
-            pass
-    
-    if not clicked:
+    if ownDriver and not acceptConsent(driver):
         print("Failed to Scrape")
+        driver.quit()
         return []
     
-    # Find and click "more" button 
-    clickMore(driver)
-    
-    time.sleep(0.1)
+    # Find and click "more" button once the first cards are there
+    with stepStats.step("cards"):
+        hasCards = waitForAny(driver, CARD_XPATH)
+    if hasCards:
+        clickMore(driver, CARD_XPATH, MORE_TIMEOUT)
 
     allLocations = []
 
     # Extract all cards from the page
-    cards = driver.find_elements(By.XPATH, '//div[@data-testid="item-id"]')
+    cards = driver.find_elements(By.XPATH, CARD_XPATH)
 
     for card in cards: # Loop over all location cards on the page
         try:
@@ -99,29 +109,26 @@ def scrapeLocations(currentMovie):
 
         allLocations.append([location[0].text, place[0].text if place else ""])
         
-    driver.quit()
+    if ownDriver:
+        driver.quit()
 
     # return scraped data
     return allLocations
 
 def scrapeArea(country = "sweden", city = "stockholm"):
-    driver = webdriver.Edge(
-        service=service,
-        options=edge_options
-    )
+    driver = newDriver()
     url = f"https://www.imdb.com/search/title/?title_type=feature&locations={country}@@@%20{city}&sort=num_votes,desc"
     print("Scraping: ", url)
-    driver.get(url)
+    load(driver, url)
 
     # Click consent
     clickConsent(driver)
-    time.sleep(0.1)
 
-    clickMore(driver, scroll = 500)
+    clickMore(driver, RESULT_XPATH)
 
-    clickMore(driver, scroll = 500)
+    clickMore(driver, RESULT_XPATH)
 
-    cards = driver.find_elements(By.XPATH, "//li[@class='ipc-metadata-list-summary-item']")
+    cards = driver.find_elements(By.XPATH, RESULT_XPATH)
 
     movies = {}
     
@@ -135,21 +142,18 @@ def scrapeArea(country = "sweden", city = "stockholm"):
     return movies
 
 def scrapePopularMovies():
-    driver = webdriver.Edge(
-        service=service,
-        options=edge_options
-    )
+    driver = newDriver()
     element_list = []
 
     # Load the URL
     url = f"https://www.imdb.com/chart/top/"
-    driver.get(url)
+    load(driver, url)
 
     # Click consent
     clickConsent(driver)
-    time.sleep(0.1)
+    waitForAny(driver, RESULT_XPATH)
 
-    cards = driver.find_elements(By.XPATH, "//li[@class='ipc-metadata-list-summary-item']")
+    cards = driver.find_elements(By.XPATH, RESULT_XPATH)
 
     movies = {}
 
@@ -161,7 +165,7 @@ def scrapePopularMovies():
 
     return movies
 
-def getPopularMovies(allMovies):
+def getPopularMovies(titleIndex):
     popularDataSet = None
     try: # Try to open if already scraped
         with open('mostPopular.pk', 'rb') as f:
@@ -170,20 +174,10 @@ def getPopularMovies(allMovies):
         print("No most popular database found, scraping and creating dataset")
         popularDataSetMovieNames = scrapePopularMovies()
         popularDataSetMovieNames.update(scrapeArea())
-        popularDataSet = []
-        for movieName in popularDataSetMovieNames.keys(): # Convert to tconst format
-            tconsts = (
-                allMovies
-                .filter((pl.col("titleType") == "movie") &
-                        (pl.col("primaryTitle").str.to_lowercase() == movieName.lower()) &
-                         (pl.col("startYear") == int(popularDataSetMovieNames[movieName]))
-                        )
-                .select("tconst")
-                .to_series()
-                .to_list()
-            )
-            if tconsts: # Sloppy, find a way to take the correct title if more are present
-                popularDataSet.append(tconsts[0])
+        # Convert to tconst format, all names in one lookup
+        pairs = [(movieName, int(year)) for movieName, year in popularDataSetMovieNames.items() if year.isdigit()]
+        tconsts = titleIndex.lookupTitles(pairs, "movie")
+        popularDataSet = [tconsts[pair] for pair in pairs if pair in tconsts]
         with open('mostPopular.pk', 'wb') as f:
             print("Dumping populardataset: ", popularDataSet)
             pk.dump(popularDataSet, f)
@@ -193,31 +187,33 @@ def getPopularMovies(allMovies):
     else:
         raise "No dataset created or found for popular movies"
 
-def getAdditionalMovies(titles, allMovies):
-    ids = []
-    for title in titles:
-        newIds = allMovies.filter(pl.col("primaryTitle").str.contains(title)) # The id of the title
-
-        newIds = newIds.filter(pl.col("titleType").str.contains("movie")) # Sort of irrelevant titles from the search
-
-        newIds = newIds.filter(~(pl.col("genres").str.contains("Documentary") |
-                                 pl.col("genres").str.contains("Music") |
-                                 pl.col("genres").str.contains("Comedy") |
-                                 pl.col("genres").str.contains("Animation")
-                                 ))
-        newIds = (newIds.select("tconst").unique()
-            .to_series()
-            .to_list()
-        )
-        
-        ids = ids + newIds
+def getAdditionalMovies(titles, titleIndex):
+    # The ids of all titles at once, the filters are applied while the index is read
+    newIds = titleIndex.search(
+        titles,
+        pl.col("titleType").cast(pl.String).str.contains("movie"), # Sort of irrelevant titles from the search
+        ~(pl.col("genres").str.contains("Documentary") |
+          pl.col("genres").str.contains("Music") |
+          pl.col("genres").str.contains("Comedy") |
+          pl.col("genres").str.contains("Animation")
+          ),
+        columns=["tconst"],
+    )
+    ids = (newIds.unique()
+        .to_series()
+        .to_list()
+    )
     print("Additional ids: ", ids)
     return ids
             
-def runScrape(): # All methods run to scrape all websites
+def saveDataset(dataset):
+    with open("locationDataset.pk", "wb") as f:
+        pk.dump(dataset, f)
+
+def runScrape(workers = WORKERS, http = True): # All methods run to scrape all websites
     titles = ["Harry Potter", "The Lord of the Rings"]
-    allMoviesDF = pl.read_csv(r"../title.basics.tsv", separator = "\t", null_values="\\N", quote_char=None)
-    allMovies = list(set(getAdditionalMovies(titles, allMoviesDF) + getPopularMovies(allMoviesDF))) #Make sure there are not duplicates
+    titleIndex = TitleIndex()
+    allMovies = list(set(getAdditionalMovies(titles, titleIndex) + getPopularMovies(titleIndex))) #Make sure there are not duplicates
 
     dataset = None
     try:
@@ -226,37 +222,46 @@ def runScrape(): # All methods run to scrape all websites
             print(dataset)
     except:
         dataset = {}
-    iter = 0
-    iterFail = 0
-    iterSkipped = 0
     print("current keys: ", dataset.keys())
-    dumped = False
 
+    # If already scraped, ignore
+    toScrape = [movie for movie in allMovies if movie not in dataset]
+    iterSkipped = len(allMovies) - len(toScrape)
+    iter = iterSkipped
+    iterFail = 0
+    print(f"Skipped {iterSkipped} movies")
+
+    # Browsers are only started for the titles plain HTTP could not do.
+    # Every browser of the pool takes the next title when it is done with one
+    pool = DriverPool(workers, newDriver, acceptConsent)
+    browserScrape = lambda movies: pool.map(lambda driver, movie: scrapeLocations(movie, driver), movies)
+    extractor = LocationExtractor(browserScrape)
+    start = time.perf_counter()
     try:
-        for movie in allMovies:
-            if movie in dataset: # If already scraped, ignore
-                print("skipped")
-                iter += 1
-                iterSkipped += 1
-                continue
-            locations = scrapeLocations(movie)
-            if len(locations) != 0:
+        for movie, locations, path in extractor.extract(toScrape, http):
+            if locations:
                 dataset[movie] = locations
             else:
                 iterFail += 1
             iter += 1
             print(f"Done with {iter}/{len(allMovies)}")
             print(f"Failed to find locations on: {iterFail} websites")
-            print(f"Skipped {iterSkipped} movies")
+            if (iter - iterSkipped)%SAVE_EVERY == 0: # Save progress
+                saveDataset(dataset)
     except KeyboardInterrupt: # Save progress
-        with open("locationDataset.pk", "wb") as f:
-            print("Dumped data ")
-            pk.dump(dataset, f)
-            dumped = True
-
-    if not dumped:
-        with open("locationDataset.pk", "wb") as f:
-            pk.dump(dataset, f)
+        print("Dumped data ")
+    finally:
+        saveDataset(dataset)
+        pool.close()
+    scraped = iter - iterSkipped
+    print(f"Scraped {scraped} titles in {time.perf_counter() - start:.1f} s with {workers} browsers: {pool.stats()}")
+    print(f"Titles per path: {extractor.summary()}")
+    for line in stepStats.summary():
+        print(line)
 
 if __name__ == '__main__':
-    runScrape()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape the filming locations of popular movies from IMDb")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="browsers scraping at the same time")
+    parser.add_argument("--browser-only", action="store_true", help="scrape every title in the browser, without trying plain HTTP first")
+    args = parser.parse_args()
+    runScrape(args.workers, not args.browser_only)
@@ -0,0 +1,137 @@
+import argparse
+import sqlite3
+import statistics
+import time
+import numpy as np
+from demoData import SYNTHETIC, addColumn, seedFeatured
+
+# Demo and test data for the database: visit counts, featured movies such as VICtorius and synthetic
+# copies of the real movies to load test the server with 10x or 100x the data.
+# Values are generated with numpy a batch at a time, staged with executemany and applied with set based
+# statements, all in one transaction so there is one commit however many rows change.
+# Only data is written: the journal mode, indexes and spatial index are convertToDatabase.py's to set up.
+
+DATABASE_PATH = "database.db"
+MAX_VISITED = 500
+JITTER_DEGREES = 0.05 # Synthetic locations are moved up to a few kilometres from the real ones
+BATCH = 50000
+# The statements the server runs, to time against the seeded size
+SERVER_QUERIES = {
+    "getLocationsByID": ("SELECT * FROM locations WHERE movie_id = ?", lambda rng, ids: (rng.choice(ids),)),
+    "getClose": ("SELECT l.* FROM locations_rtree r JOIN locations l ON l.id = r.id "
+                 "WHERE r.maxLat >= ? AND r.minLat <= ? AND r.maxLon >= ? AND r.minLon <= ?",
+                 lambda rng, ids: (59.30, 59.35, 18.0, 18.1)),
+    # What the server runs instead when the database has no spatial index
+    "getClose (no spatial index)": ("SELECT * FROM locations WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?",
+                                    lambda rng, ids: (59.30, 59.35, 18.0, 18.1)),
+    "getByTitle": ("SELECT * FROM movies WHERE title LIKE '%' || ? || '%' COLLATE NOCASE", lambda rng, ids: ("lord",)),
+    "getTitleByGenre": ("SELECT * FROM movies WHERE genre = ?", lambda rng, ids: ("Drama",)),
+}
+
+
+def connect(path=DATABASE_PATH):
+    # A plain connection, nothing set here outlives it
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def seedVisited(conn, rng):
+    # Random visit counts for every location, staged in a temp table and set with one UPDATE
+    addColumn(conn, "locations", "visited INT")
+    ids = np.array([id for id, in conn.execute("SELECT id FROM locations")], dtype=np.int64)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS seedVisited(id INTEGER PRIMARY KEY, visited INT)")
+    conn.execute("DELETE FROM seedVisited")
+    for start in range(0, len(ids), BATCH):
+        batch = ids[start:start + BATCH]
+        visited = rng.integers(0, MAX_VISITED + 1, len(batch))
+        conn.executemany("INSERT INTO seedVisited (id, visited) VALUES (?, ?)", zip(batch.tolist(), visited.tolist()))
+    conn.execute("UPDATE locations SET visited = s.visited FROM seedVisited s WHERE locations.id = s.id")
+    return len(ids)
+
+def clearSynthetic(conn):
+    pattern = f"%{SYNTHETIC}%"
+    removed = conn.execute("DELETE FROM locations WHERE movie_id LIKE ?", (pattern,)).rowcount
+    return removed + conn.execute("DELETE FROM movies WHERE id LIKE ?", (pattern,)).rowcount
+
+def seedSynthetic(conn, rng, scale):
+    # Makes the database scale times its real size: every real movie gets scale - 1 copies whose locations
+    # are moved a little, so spatial queries find realistic clusters. Earlier copies are replaced
+    removed = clearSynthetic(conn)
+    if scale <= 1:
+        return removed
+    hasPlot = "plot" in {row[1] for row in conn.execute("PRAGMA table_info(movies)")}
+    hasVisited = "visited" in {row[1] for row in conn.execute("PRAGMA table_info(locations)")}
+    movies = conn.execute("SELECT id, title, genre, year, runTime FROM movies").fetchall()
+    locations = conn.execute("SELECT movie_id, lat, lon, place, info FROM locations WHERE lat IS NOT NULL AND lon IS NOT NULL").fetchall()
+    movieIds, lats, lons, places, infos = zip(*locations) if locations else ((), (), (), (), ())
+    lats, lons = np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64)
+    movieInsert = ("INSERT INTO movies (id, title, genre, year, runTime, plot) VALUES (?, ?, ?, ?, ?, '')" if hasPlot
+                   else "INSERT INTO movies (id, title, genre, year, runTime) VALUES (?, ?, ?, ?, ?)")
+    locationInsert = ("INSERT INTO locations (movie_id, lat, lon, place, info, visited) VALUES (?, ?, ?, ?, ?, ?)" if hasVisited
+                      else "INSERT INTO locations (movie_id, lat, lon, place, info) VALUES (?, ?, ?, ?, ?)")
+
+    rows = removed
+    for copy in range(1, scale):
+        suffix = f"{SYNTHETIC}{copy}"
+        conn.executemany(movieInsert, [(id + suffix, f"{title} ({copy})", genre, year, runTime)
+                                       for id, title, genre, year, runTime in movies])
+        copyLats = np.clip(lats + rng.uniform(-JITTER_DEGREES, JITTER_DEGREES, len(lats)), -90, 90)
+        copyLons = (lons + rng.uniform(-JITTER_DEGREES, JITTER_DEGREES, len(lons)) + 180) % 360 - 180
+        columns = [[id + suffix for id in movieIds], copyLats.tolist(), copyLons.tolist(), places, infos]
+        if hasVisited:
+            columns.append(rng.integers(0, MAX_VISITED + 1, len(lats)).tolist())
+        conn.executemany(locationInsert, zip(*columns))
+        rows += len(movies) + len(locations)
+    return rows
+
+def timeQueries(conn, rng, repeats=50):
+    # Median milliseconds of every server query at the current size
+    ids = [id for id, in conn.execute("SELECT id FROM movies")]
+    hasTree = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'locations_rtree'").fetchone() is not None
+    for name, (query, makeParams) in SERVER_QUERIES.items():
+        if ("locations_rtree" in query) != hasTree and name.startswith("getClose"): # Only the one the server uses
+            continue
+        samples = []
+        for _ in range(repeats):
+            params = makeParams(rng, ids)
+            start = time.perf_counter()
+            conn.execute(query, params).fetchall()
+            samples.append((time.perf_counter() - start)*1000)
+        print(f"{name}: {statistics.median(samples):.3f} ms")
+
+def seed(database=DATABASE_PATH, visited=True, featured=True, scale=None, seedValue=None, clear=False, timing=False):
+    conn = connect(database)
+    rng = np.random.default_rng(seedValue)
+    start = time.perf_counter()
+    rows = 0
+    with conn: # One transaction for everything
+        if clear:
+            rows += clearSynthetic(conn)
+        if featured:
+            rows += seedFeatured(conn)
+        if scale is not None: # Before the visits, so the copies get theirs too
+            rows += seedSynthetic(conn, rng, scale)
+        if visited:
+            rows += seedVisited(conn, rng)
+    elapsed = time.perf_counter() - start
+    movies, = conn.execute("SELECT COUNT(*) FROM movies").fetchone()
+    locations, = conn.execute("SELECT COUNT(*) FROM locations").fetchone()
+    print(f"Wrote {rows} rows in {elapsed:.2f} s ({rows/max(elapsed, 1e-9):.0f} rows/s), "
+          f"database has {movies} movies and {locations} locations")
+    if timing:
+        timeQueries(conn, rng)
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seed the database with demo data, visit counts and synthetic movies")
+    parser.add_argument("--database", default=DATABASE_PATH)
+    parser.add_argument("--no-visited", action="store_true", help="leave the visit counts as they are")
+    parser.add_argument("--no-featured", action="store_true", help="do not add the featured movies")
+    parser.add_argument("--scale", type=int, help="make the database this many times its real size, 1 removes the copies")
+    parser.add_argument("--clear-synthetic", action="store_true", help="remove the synthetic copies")
+    parser.add_argument("--seed", type=int, help="random seed, for the same data every time")
+    parser.add_argument("--time-queries", action="store_true", help="time the server's queries afterwards")
+    args = parser.parse_args()
+    seed(args.database, not args.no_visited, not args.no_featured, args.scale, args.seed, args.clear_synthetic, args.time_queries)
@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# The scraper modules are scripts run from webScraper/, make them importable from the tests
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import pytest
+import geocoder
+from geocodeCache import normaliseQuery
+from geocodeStandIn import StandInServer
+from geocoder import Geocoder, NominatimProvider
+
+# The geocoder against geocodeStandIn.py on a free port. The stand-in does not find queries with more than
+# three comma separated parts, so longer ones have to be found through their fallbacks.
+
+
+def serve(**kwargs):
+    server = StandInServer(("localhost", 0), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def standIn():
+    server = serve(rate=1000)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def makeGeocoder(server, rate=500, burst=10, **kwargs):
+    host, port = server.server_address[:2]
+    return Geocoder(NominatimProvider(f"http://{host}:{port}/search", rate=rate, burst=burst, name="test"), **kwargs)
+
+
+def placeOf(query):
+    # The display name the stand-in gives a query it finds
+    return normaliseQuery(query).title()
+
+
+def test_theMostSpecificFallbackThatIsFoundWins(standIn):
+    async def run():
+        geo = makeGeocoder(standIn)
+        found = await geo.geocode("Bag End, Hobbiton, Matamata, Waikato, New Zealand")
+        notFound = await geo.geocode("a, b, c, d")
+        return geo, found, notFound
+
+    geo, found, notFound = asyncio.run(run())
+    # Queries of four or five parts are not found, so parts are left out until three are left
+    assert found[0] == placeOf("Matamata, Waikato, New Zealand")
+    assert notFound[0] == placeOf("b, c, d")
+    # The query and all its fallbacks are sent at once, shorter ones too
+    assert geo.stats["requests"] == 5 + 4
+    geo.session.close()
+
+
+def test_repeatedAddressesAreOnlySentOnce(standIn):
+    locationSet = {
+        "tt1": [["Hobbiton, Matamata, New Zealand", "The Shire"]],
+        "tt2": [["hobbiton,  Matamata ,New Zealand", ""], ["Wellington, New Zealand", ""]],
+        "tt3": [["Wellington, New Zealand", "Weta"], ["HOBBITON, MATAMATA, NEW ZEALAND", ""]],
+    }
+    geo = makeGeocoder(standIn)
+    results = asyncio.run(geo.geocodeLocations(locationSet))
+
+    assert geo.stats["requests"] == 2
+    assert geo.stats["shared"] == 3
+    assert geo.stats["found"] == 5
+    hobbiton = placeOf("Hobbiton, Matamata, New Zealand")
+    assert results["tt1"][0][2] == hobbiton and results["tt3"][1][2] == hobbiton
+    assert results["tt2"][0][3] == results["tt3"][1][3]
+
+
+def test_rateLimitedRequestsBackOffAndAreRetried(monkeypatch):
+    monkeypatch.setattr(geocoder, "BACKOFF_BASE", 0.05)
+    server = serve(rate=5)
+    try:
+        geo = makeGeocoder(server, rate=50, burst=5)
+        paused = []
+        pause = geo.bucket.pause
+        monkeypatch.setattr(geo.bucket, "pause", lambda seconds: paused.append(seconds) or pause(seconds))
+        places = [f"Place {i}, New Zealand" for i in range(15)]
+        results = asyncio.run(geo.geocodeLocations({"tt1": [[place, ""] for place in places]}))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert geo.stats["rateLimited"] == server.limited > 0
+    # Every 429 stops the whole bucket for at least the Retry-After of the answer
+    assert len(paused) == geo.stats["rateLimited"] and min(paused) >= 1
+    assert geo.stats["failed"] == 0
+    assert len(results["tt1"]) == len(places)
+
+
+def test_answersThatAreNotJsonAreRetried(monkeypatch):
+    monkeypatch.setattr(geocoder, "BACKOFF_BASE", 0.01)
+    server = serve(rate=1000, badAnswers=3)
+    try:
+        geo = makeGeocoder(server)
+        found = asyncio.run(geo.geocode("Wellington, New Zealand"))
+
+        # Only bad answers, given up on after the retries
+        server.badAnswers = 10
+        failing = makeGeocoder(server, retries=2)
+        with pytest.raises(geocoder.GeocodeError):
+            asyncio.run(failing.geocode("Auckland, New Zealand"))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert found[0] == placeOf("Wellington, New Zealand")
+    assert geo.stats["badAnswers"] == 3
+    assert geo.stats["requests"] == 4
+    assert failing.stats["badAnswers"] == 3
+    assert failing.stats["failed"] == 1
@@ -0,0 +1,87 @@
+import pathlib
+import pytest
+from locationExtractor import LocationExtractor, parseCards, parseLocations, parseNextData, selectLocations
+
+# The parsers against saved locations pages in fixtures/, offline. The pages are cut down to the markup
+# the parsers read: the __NEXT_DATA__ script and the location cards with their vote counts.
+
+FIXTURES = pathlib.Path(__file__).resolve().parent / "fixtures"
+HOBBITON = ["Hobbiton, Matamata, Waikato, New Zealand", "The Shire"]
+TONGARIRO = ["Tongariro National Park, New Zealand", "Mount Doom"]
+WELLINGTON = ["Wellington, New Zealand", ""]
+
+
+def page(name):
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+
+def test_selectLocationsStopsAtTheVoteCutoff():
+    cards = [("a", "", 10), ("b", "", 6), ("c", "", 5), ("d", "", 40)]
+    assert selectLocations(cards) == ([["a", ""], ["b", ""]], True)
+    assert selectLocations([("a", "", None)]) == ([], True)
+    assert selectLocations([("a", "x", 9)]) == ([["a", "x"]], False)
+
+
+def test_nextDataComplete():
+    assert parseNextData(page("nextDataComplete.html")) == ([HOBBITON, TONGARIRO, WELLINGTON], True)
+    assert parseLocations(page("nextDataComplete.html")) == ([HOBBITON, TONGARIRO, WELLINGTON], "json")
+
+
+def test_nextDataWithMoreToLoad():
+    locations, complete = parseNextData(page("nextDataMore.html"))
+    assert not complete # 5 of 42 items and none under the cutoff
+    assert len(locations) == 5
+    assert locations[1] == ["Tongariro National Park, New Zealand", "Scene, 1"] # Scene parts are joined
+    # The cards have a see more button too, so only the browser can get the rest
+    assert parseCards(page("nextDataMore.html"))[1] is False
+    assert parseLocations(page("nextDataMore.html")) == (None, None)
+
+
+def test_cardsWithoutNextData():
+    assert parseNextData(page("cardsOnly.html")) is None
+    assert parseLocations(page("cardsOnly.html")) == ([HOBBITON, TONGARIRO], "cards")
+
+
+def test_brokenNextDataFallsBackToCards():
+    assert parseNextData(page("brokenNextData.html")) is None
+    # The cutoff is reached before the see more button, so the cards are the full list
+    assert parseCards(page("brokenNextData.html")) == ([HOBBITON, TONGARIRO, WELLINGTON], True)
+    assert parseLocations(page("brokenNextData.html")) == ([HOBBITON, TONGARIRO, WELLINGTON], "cards")
+
+
+def test_challengePageNeedsTheBrowser():
+    assert parseNextData(page("challenge.html")) is None
+    assert parseCards(page("challenge.html")) is None
+    assert parseLocations(page("challenge.html")) == (None, None)
+
+
+@pytest.fixture
+def savedPages(monkeypatch):
+    # Serves the fixtures by title id instead of fetching them
+    pages = {"tt1": "nextDataComplete.html", "tt2": "cardsOnly.html", "tt3": "challenge.html", "tt4": "nextDataMore.html"}
+    monkeypatch.setattr(LocationExtractor, "fetch", lambda self, title: page(pages[title]))
+    return pages
+
+
+def test_extractOnlySendsWhatHttpCouldNotDoToTheBrowser(savedPages):
+    sentToBrowser = []
+
+    def browserScrape(titles):
+        sentToBrowser.extend(titles)
+        for title in titles:
+            yield title, [["From the browser", ""]], None
+
+    extractor = LocationExtractor(browserScrape, fetchWorkers=2)
+    results = {title: (locations, path) for title, locations, path in extractor.extract(list(savedPages))}
+    assert sorted(sentToBrowser) == ["tt3", "tt4"]
+    assert results["tt1"] == ([HOBBITON, TONGARIRO, WELLINGTON], "json")
+    assert results["tt2"] == ([HOBBITON, TONGARIRO], "cards")
+    assert results["tt3"] == ([["From the browser", ""]], "browser")
+    assert extractor.paths == {"json": 1, "cards": 1, "browser": 2}
+
+
+def test_extractWithoutBrowserMarksTheRestFailed(savedPages):
+    extractor = LocationExtractor(fetchWorkers=2)
+    paths = {title: path for title, _, path in extractor.extract(["tt1", "tt3"])}
+    assert paths == {"tt1": "json", "tt3": "failed"}
+    assert extractor.summary() == "json 1 (50%), cards 0 (0%), browser 0 (0%), failed 1 (50%)"
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import pytest
+from omdbEnricher import Enricher
+from omdbStandIn import StandInServer
+
+# The enrichment against omdbStandIn.py on a free port. The stand-in does not know ids whose sha1 starts
+# with a byte that is 0 mod 10 and has no poster for 1 mod 10.
+
+IDS = [f"tt{i:07d}" for i in range(60)]
+
+
+def kind(id):
+    return hashlib.sha1(id.encode()).digest()[0] % 10
+
+
+@pytest.fixture
+def standIn():
+    server = StandInServer(("localhost", 0), rate=1000)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "database.db")
+    conn.execute("CREATE TABLE movies(id TEXT PRIMARY KEY, title TEXT NOT NULL, genre TEXT, year TEXT, runTime TEXT)")
+    conn.executemany("INSERT INTO movies (id, title) VALUES (?, ?)", [(id, id) for id in IDS + ["tt0000001-syn1"]])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def enrich(conn, server, posterDir, **kwargs):
+    host, port = server.server_address[:2]
+    enricher = Enricher(conn, "test", f"http://{host}:{port}/", rate=500, workers=8, posterDir=posterDir, **kwargs)
+    return asyncio.run(enricher.run())
+
+
+def test_enrichFetchesPlotsAndPosters(standIn, conn, tmp_path):
+    posterDir = tmp_path / "posters"
+    stats = enrich(conn, standIn, posterDir)
+
+    known = [id for id in IDS if kind(id) != 0]
+    withPoster = [id for id in known if kind(id) != 1]
+    assert stats["requests"] == len(IDS) # One request per title, the synthetic copy is not sent
+    assert stats["plots"] == len(known)
+    assert stats["notFound"] == len(IDS) - len(known)
+    assert stats["noPoster"] == len(known) - len(withPoster)
+    assert sorted(path.stem for path in posterDir.glob("*.jpg")) == withPoster
+    assert not list(posterDir.glob("*.part"))
+    plots = dict(conn.execute("SELECT id, plot FROM movies"))
+    assert plots[known[0]] == f"The made-up plot of {known[0]}."
+    assert plots["tt0000001-syn1"] is None
+
+
+def test_secondRunSkipsTitlesKnownToBeMissing(standIn, conn, tmp_path):
+    posterDir = tmp_path / "posters"
+    enrich(conn, standIn, posterDir)
+    asked = sum(standIn.perId.values())
+
+    stats = enrich(conn, standIn, posterDir)
+    assert stats["requests"] == 0
+    assert sum(standIn.perId.values()) == asked
+    statuses = dict(conn.execute("SELECT movie_id, status FROM omdb_attempts"))
+    assert {id for id, status in statuses.items() if status == "notFound"} == {id for id in IDS if kind(id) == 0}
+    assert {id for id, status in statuses.items() if status == "noPoster"} == {id for id in IDS if kind(id) == 1}
+
+    # Asked for again when told to, and titles without a poster still do not get one
+    stats = enrich(conn, standIn, posterDir, retryMissing=True)
+    assert stats["requests"] == len([id for id in IDS if kind(id) in (0, 1)])
+    assert stats["posters"] == 0
+
+
+def test_rateLimitedRequestsAreRetried(conn, tmp_path):
+    server = StandInServer(("localhost", 0), rate=5)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with conn:
+            conn.execute(f"DELETE FROM movies WHERE id NOT IN ({', '.join('?'*12)})", IDS[:12])
+        host, port = server.server_address[:2]
+        enricher = Enricher(conn, "test", f"http://{host}:{port}/", rate=50, workers=8, posterDir=tmp_path / "posters")
+        stats = asyncio.run(enricher.run())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert stats["rateLimited"] > 0
+    assert stats["failed"] == 0
+    assert stats["plots"] + stats["notFound"] == 12
@@ -0,0 +1,130 @@
+import argparse
+import contextlib
+import os
+import re
+import sys
+import time
+import polars as pl
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+# Typed, columnar copy of the IMDb title.basics.tsv dump with the title types we use.
+# The dump is converted once to Parquet and lookups resolve whole batches of keys in one join instead of
+# scanning every row of the dump for every title. Both the conversion and the lookups are lazy queries run
+# on the streaming engine, so only the columns and row groups a query needs are read and memory stays
+# bounded by the batch size rather than the size of the dump.
+
+TITLES_TSV = "../title.basics.tsv"
+TITLES_PARQUET = "../titleBasics.parquet"
+TITLE_TYPES = ("movie", "tvMovie")
+COLUMNS = {
+    "tconst": pl.String,
+    "titleType": pl.Categorical,
+    "primaryTitle": pl.String,
+    "startYear": pl.Int16,
+    "runtimeMinutes": pl.Int32,
+    "genres": pl.String,
+}
+
+
+def peakMemoryMb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024**2 if sys.platform == "darwin" else peak/1024 # Bytes on macOS, kilobytes on Linux
+
+@contextlib.contextmanager
+def report(name):
+    # Prints how long the block took and the peak memory of the process after it
+    start = time.perf_counter()
+    yield
+    peak = peakMemoryMb()
+    memory = f", peak RSS {peak:.0f} MB" if peak is not None else ""
+    print(f"{name}: {time.perf_counter() - start:.2f} s{memory}")
+
+def collect(query):
+    return query.collect(engine="streaming")
+
+def scanDump(tsvPath=TITLES_TSV):
+    # The dump as a lazy frame, only the columns a query selects are parsed
+    return pl.scan_csv(tsvPath, separator="\t", null_values="\\N", quote_char=None,
+                       schema_overrides={column: dtype for column, dtype in COLUMNS.items() if dtype != pl.Categorical})
+
+def buildIndex(tsvPath=TITLES_TSV, parquetPath=TITLES_PARQUET, titleTypes=TITLE_TYPES):
+    # The dump is already ordered by tconst, so the rows are streamed through without a sort
+    with report(f"Converting {tsvPath}"):
+        (
+            scanDump(tsvPath)
+            .select(list(COLUMNS))
+            .filter(pl.col("titleType").is_in(titleTypes))
+            .with_columns(pl.col("titleType").cast(pl.Categorical))
+            # Lookups by name ignore case, like the scraped titles did before
+            .with_columns(titleKey=pl.col("primaryTitle").str.to_lowercase())
+            .sink_parquet(parquetPath, statistics=True, engine="streaming")
+        )
+    print(f"Wrote {pl.scan_parquet(parquetPath).select(pl.len()).collect().item()} titles to {parquetPath}")
+
+def isStale(tsvPath=TITLES_TSV, parquetPath=TITLES_PARQUET):
+    # A newer dump means the index has to be converted again
+    if not os.path.exists(parquetPath):
+        return True
+    return os.path.exists(tsvPath) and os.path.getmtime(tsvPath) > os.path.getmtime(parquetPath)
+
+
+class TitleIndex:
+
+    def __init__(self, parquetPath=TITLES_PARQUET, tsvPath=TITLES_TSV):
+        if isStale(tsvPath, parquetPath):
+            print(f"No up to date title index at {parquetPath}, converting {tsvPath}")
+            buildIndex(tsvPath, parquetPath)
+        self.titles = pl.scan_parquet(parquetPath)
+
+    def lookupIds(self, ids, columns=None):
+        # The rows of the given tconsts, missing ids are left out
+        ids = list(set(ids))
+        query = self.titles.filter(pl.col("tconst").is_in(ids))
+        if columns is not None:
+            query = query.select(columns)
+        with report(f"Looking up {len(ids)} ids"):
+            return collect(query)
+
+    def lookupTitles(self, pairs, titleType=None):
+        # pairs are (title, year). Returns {(title, year): tconst}, the lowest tconst when several titles match
+        keys = pl.LazyFrame(
+            [(title, title.lower(), year) for title, year in pairs],
+            schema={"title": pl.String, "titleKey": pl.String, "startYear": pl.Int16},
+            orient="row",
+        )
+        # Filters on the scan are pushed into the Parquet reader, the join only sees candidate rows
+        titles = self.titles.filter(pl.col("startYear").is_in(list({year for _, year in pairs})))
+        if titleType is not None:
+            titles = titles.filter(pl.col("titleType") == titleType)
+        query = (
+            keys.join(titles.select("titleKey", "startYear", "tconst"), on=["titleKey", "startYear"], how="inner")
+            .group_by("title", "startYear")
+            .agg(pl.col("tconst").min())
+        )
+        with report(f"Looking up {len(pairs)} titles"):
+            matches = collect(query)
+        return {(title, year): tconst for title, year, tconst in matches.iter_rows()}
+
+    def search(self, titles, *predicates, columns=None):
+        # All rows whose title contains any of the given titles and that match the predicates, in one pass
+        pattern = "|".join(re.escape(title) for title in titles)
+        query = self.titles.filter(pl.col("primaryTitle").str.contains(pattern), *predicates)
+        if columns is not None:
+            query = query.select(columns)
+        with report(f"Searching {len(titles)} titles"):
+            return collect(query)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the IMDb title.basics.tsv dump to a Parquet title index")
+    parser.add_argument("--tsv", default=TITLES_TSV)
+    parser.add_argument("--parquet", default=TITLES_PARQUET)
+    parser.add_argument("--types", nargs="+", default=list(TITLE_TYPES), help="title types to keep")
+    args = parser.parse_args()
+    buildIndex(args.tsv, args.parquet, args.types)
@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+# Token bucket rate limiting, shared by the scrapers that call rate limited APIs (geocoder.py, omdbEnricher.py).
+
+
+class TokenBucket:
+    # Lets rate requests per second through, with bursts of up to capacity
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blockedUntil = 0.0
+        self.lock = asyncio.Lock() # Waiters get their tokens in the order they asked
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blockedUntil:
+                    await asyncio.sleep(self.blockedUntil - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens)/self.rate)
+
+    def pause(self, seconds):
+        # Stops handing out tokens for a while, used when the provider says we are too fast
+        self.blockedUntil = max(self.blockedUntil, time.monotonic() + seconds)
+        self.tokens = 0